@@ -0,0 +1,59 @@
+import os
+import sys
+import argparse
+import resource
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from features import DEFAULT_WINDOWS, build_features  # noqa: E402
+from formats import FORMATS  # noqa: E402
+from models.kdd import KDD_Hardcoded  # noqa: E402
+
+
+# Rows/sec of features.py on a synthetic collect_data.py output (rows ordered by date, as collect_data.py writes)
+
+
+def generate_dataset(filepath, n_drives, n_days, seed):
+    rng = np.random.default_rng(seed)
+    serial_numbers = np.char.add('ZA', np.arange(n_drives).astype('U10'))
+    dates = pd.date_range('2018-01-01', periods=n_days).strftime('%Y-%m-%d')
+    counters = rng.poisson(1, (n_drives, len(KDD_Hardcoded.ATTRIBUTES))).astype(float)
+    with open(filepath, 'w') as f:
+        for day_idx, date in enumerate(dates):
+            counters += rng.random(counters.shape) < 0.01  # rare changes of attributes
+            day = pd.DataFrame(counters, columns=KDD_Hardcoded.ATTRIBUTES)
+            day.insert(0, 'failure', 0)
+            day.insert(0, 'model', 'ST4000DM000')
+            day.insert(0, 'serial_number', serial_numbers)
+            day.insert(0, 'date', date)
+            day.to_csv(f, header=day_idx == 0, index=False)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('--drives', type=int, default=10*1000)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--chunksize', type=int, default=256*1024)
+    parser.add_argument('--format', type=str, choices=FORMATS, default='csv', help='format of features')
+    parser.add_argument('--seed', type=int, default=17)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    with tempfile.TemporaryDirectory() as folder:
+        filepath = os.path.join(folder, 'model_2018_ST4000DM000.csv')
+        generate_dataset(filepath, args.drives, args.days, args.seed)
+        out_filepath = os.path.join(folder, 'features.' + args.format)
+        n_rows, seconds = build_features(filepath, out_filepath, KDD_Hardcoded.ATTRIBUTES, DEFAULT_WINDOWS,
+                                         chunksize=args.chunksize)
+        print({
+            'format': args.format,
+            'rows': n_rows,
+            'input_mb': round(os.path.getsize(filepath) / 2**20, 1),
+            'seconds': round(seconds, 2),
+            'rows_per_sec': round(n_rows / seconds),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        })
@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from sdfp import COMMANDS  # noqa: E402
+
+
+# Startup time of the command line: "sdfp.py <command> --help" against "<script>.py --help".
+# A script imports pandas and its other dependencies before parsing arguments, sdfp.py imports them to run a command only.
+# Times are medians of fresh interpreters, "-X importtime" gives the imported modules.
+HEAVY_MODULES = ['pandas', 'numpy', 'requests', 'tqdm', 'pyarrow']
+
+
+def run(argv, repeats):
+    seconds = []
+    for _ in range(repeats):
+        start = time.time()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        seconds.append(time.time() - start)
+    return statistics.median(seconds)
+
+
+def get_heavy_imports(argv):
+    stderr = subprocess.run([sys.executable, '-X', 'importtime'] + argv, cwd=ROOT, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True).stderr
+    modules = {line.rsplit('|', 1)[-1].strip() for line in stderr.splitlines() if line.startswith('import time:')}
+    return [module for module in HEAVY_MODULES if module in modules]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('-c', '--command', type=str, action='append', choices=list(COMMANDS),
+                        help='all commands by default')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--out', type=str, default=None, help='json file with results')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    results = []
+    for command in args.command or COMMANDS:
+        script = COMMANDS[command][0] + '.py'
+        sdfp_argv, script_argv = ['sdfp.py', command, '--help'], [script, '--help']
+        sdfp_seconds, script_seconds = run(sdfp_argv, args.repeats), run(script_argv, args.repeats)
+        results.append({
+            'command': command,
+            'script': script,
+            'sdfp_seconds': round(sdfp_seconds, 3),
+            'script_seconds': round(script_seconds, 3),
+            'speedup': round(script_seconds / sdfp_seconds, 1),
+            'sdfp_heavy_imports': get_heavy_imports(sdfp_argv),
+            'script_heavy_imports': get_heavy_imports(script_argv),
+        })
+        print(json.dumps(results[-1]), file=sys.stderr)
+    report = {'python': sys.version.split()[0], 'repeats': args.repeats, 'commands': results}
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
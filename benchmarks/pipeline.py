@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from queue import Empty
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from synthetic_dataset import MANIFEST, generate_dataset, load_manifest  # noqa: E402
+
+
+# Offline benchmark of pipeline stages on a synthetic dataset (see synthetic_dataset.py).
+# Every stage runs in a fresh process, so peak RSS belongs to the stage only.
+# Stages use outputs of previous ones: stats -> collect_data -> remove_nans, kdd.
+# Results are printed as json and can be saved (--out) to compare commits.
+STAGES = ['stats', 'collect_data', 'remove_nans', 'kdd']
+ENGINES = ['rows', 'columnar', 'compact']
+
+
+def count_rows(filepath):
+    with open(filepath) as f:
+        return sum(1 for _ in f) - 1
+
+
+def year_files(manifest, year):
+    return {path: info for path, info in manifest['files'].items() if path.startswith(str(year) + os.sep)}
+
+
+def run_stats(folder, work, manifest, args, engine):
+    from collect_stats import icollect_stats, save_stats
+    start = time.time()
+    for year, stats in icollect_stats(folder, engine=engine):
+        save_stats(stats, os.path.join(work, 'stats.csv'), year)
+    files = manifest['files'].values()
+    return time.time() - start, sum(f['rows'] for f in files), len(files), sum(f['bytes'] for f in files)
+
+
+def run_collect_data(folder, work, manifest, args):
+    from collect_data import collect_data
+    year = args.year[0]  # the first year of a dataset
+    start = time.time()
+    collect_data(os.path.join(folder, str(year)), os.path.join(work, 'stats_{}.csv'.format(year)),
+                 os.path.join(work, 'dataset.csv'), args.model, args.days_before, args.health_drives)
+    files = year_files(manifest, year).values()  # rows read to dump windows
+    return time.time() - start, sum(f['rows'] for f in files), len(files), sum(f['bytes'] for f in files)
+
+
+def run_remove_nans(folder, work, manifest, args):
+    from remove_nans import remove_nans_from_file
+    filepath = os.path.join(work, 'dataset_nans.csv')
+    shutil.copy(os.path.join(work, 'dataset.csv'), filepath)
+    start = time.time()
+    remove_nans_from_file(filepath)
+    return time.time() - start, count_rows(filepath), 1, os.path.getsize(os.path.join(work, 'dataset.csv'))
+
+
+def run_kdd(folder, work, manifest, args):
+    from formats import read_table
+    from models.kdd import KDD_Hardcoded
+    filepath = os.path.join(work, 'dataset.csv')
+    df = read_table(filepath)
+    start = time.time()  # predictions only
+    KDD_Hardcoded().predict(df)
+    return time.time() - start, len(df), 1, os.path.getsize(filepath)
+
+
+def run_stage(name, folder, work, args, engine, queue):
+    sys.path.insert(0, ROOT)
+    manifest = load_manifest(folder)
+    if name == 'stats':
+        seconds, rows, files, size = run_stats(folder, work, manifest, args, engine)
+    else:
+        stage = {'collect_data': run_collect_data, 'remove_nans': run_remove_nans, 'kdd': run_kdd}[name]
+        seconds, rows, files, size = stage(folder, work, manifest, args)
+    seconds = max(seconds, 1e-9)
+    queue.put({
+        'stage': name if engine is None else '{}_{}'.format(name, engine),
+        'seconds': round(seconds, 3),
+        'rows': rows,
+        'files': files,
+        'mb': round(size / 2**20, 1),
+        'rows_per_sec': round(rows / seconds),
+        'files_per_sec': round(files / seconds, 2),
+        'mb_per_sec': round(size / 2**20 / seconds, 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+
+
+def measure(name, folder, work, args, engine=None):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_stage, args=(name, folder, work, args, engine, queue))
+    process.start()
+    # a failed stage never puts its result, its traceback is printed by the child
+    stage = name if engine is None else '{}_{}'.format(name, engine)
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            if process.is_alive():
+                continue
+            try:  # the result could be put right before the exit
+                result = queue.get(timeout=1)
+                break
+            except Empty:
+                process.join()
+                raise RuntimeError('Stage {} failed with exit code {}'.format(stage, process.exitcode))
+    process.join()
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('--folder', type=str, default='synthetic_data', help='generated if there is no dataset')
+    parser.add_argument('--work', type=str, default='benchmark_work', help='folder for outputs of stages')
+    parser.add_argument('--out', type=str, default=None, help='json file with results')
+    parser.add_argument('-s', '--stage', type=str, action='append', choices=STAGES, help='all stages by default')
+    parser.add_argument('-e', '--engine', type=str, action='append', choices=ENGINES,
+                        help='engines of collect_stats.py, all by default')
+    parser.add_argument('-y', '--year', type=int, action='append', help='years of a generated dataset, 2018 by default')
+    parser.add_argument('--days', type=int, default=60, help='days per year of a generated dataset')
+    parser.add_argument('--drives', type=int, default=5000, help='drives of a generated dataset')
+    parser.add_argument('--failure_rate', type=float, default=0.001)
+    parser.add_argument('--seed', type=int, default=17)
+    parser.add_argument('--model', type=str, default='ST4000DM000', help='model of collect_data.py')
+    parser.add_argument('--days_before', type=int, default=30)
+    parser.add_argument('--health_drives', type=int, default=1000)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    args.year = args.year or [2018]
+    if not os.path.exists(os.path.join(args.folder, MANIFEST)):
+        generate_dataset(args.folder, args.year, args.days, args.drives, failure_rate=args.failure_rate,
+                         seed=args.seed)
+    manifest = load_manifest(args.folder)
+    args.year = sorted({int(path.split(os.sep)[0]) for path in manifest['files']})  # of an existing dataset
+    os.makedirs(args.work, exist_ok=True)
+    results = []
+    for name in args.stage or STAGES:
+        engines = (args.engine or ENGINES) if name == 'stats' else [None]
+        for engine in engines:
+            results.append(measure(name, args.folder, args.work, args, engine))
+            print(json.dumps(results[-1]), file=sys.stderr)
+    report = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'dataset': {'folder': args.folder, 'drives': manifest['drives'], 'files': len(manifest['files']),
+                    'rows': sum(f['rows'] for f in manifest['files'].values()), 'seed': manifest['seed']},
+        'stages': results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
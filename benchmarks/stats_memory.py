@@ -0,0 +1,72 @@
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from collect_stats import SDStats, CompactSDStats, ColumnarSDStats  # noqa: E402
+
+
+# Memory of stats per tracked drive on a synthetic fleet, every day is a new DataFrame as after pd.read_csv.
+# peak_bytes_per_drive includes the day being added, seconds are slowed down by tracemalloc
+MODELS = ['ST4000DM000', 'ST12000NM0007', 'HGST HMS5C4040BLE640', 'ST8000NM0055', 'WDC WD30EFRX']
+
+
+def generate_day(serial_numbers, models, date, failure_rate, rng):
+    failure = (rng.random(len(serial_numbers)) < failure_rate).astype(int)
+    return pd.DataFrame({
+        'date': [date] * len(serial_numbers),
+        'serial_number': [str(sn) for sn in serial_numbers],  # new string objects every day
+        'model': models,
+        'failure': failure,
+    })
+
+
+def measure(stats_cls, n_drives, n_days, failure_rate, seed):
+    rng = np.random.default_rng(seed)
+    serial_numbers = np.char.add('ZA', np.arange(n_drives).astype('U10'))
+    models = rng.choice(MODELS, n_drives)
+    dates = pd.date_range('2018-01-01', periods=n_days).strftime('%Y-%m-%d')
+    tracemalloc.start()
+    stats, seconds, peak = stats_cls(), 0, 0
+    for file_idx, date in enumerate(dates):
+        df = generate_day(serial_numbers, models, date, failure_rate, rng)
+        samples = df.to_dict(orient='records') if stats_cls is SDStats else None
+        tracemalloc.reset_peak()
+        start = time.time()
+        if stats_cls is SDStats:
+            for sample in samples:
+                stats.add(sample)
+        else:
+            stats.add_day(df, file_idx)
+        seconds += time.time() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        del df, samples
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {
+        'engine': stats_cls.__name__,
+        'drives': n_drives,
+        'days': n_days,
+        'bytes_per_drive': round(current / n_drives, 1),
+        'peak_bytes_per_drive': round(peak / n_drives, 1),
+        'seconds': round(seconds, 2),
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('--drives', type=int, default=1000*1000)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--failure_rate', type=float, default=0.0001)
+    parser.add_argument('--seed', type=int, default=17)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    for stats_cls in [SDStats, ColumnarSDStats, CompactSDStats]:
+        print(measure(stats_cls, args.drives, args.days, args.failure_rate, args.seed))
@@ -0,0 +1,117 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+
+# Synthetic dataset in the layout of download_dataset.py: <folder>/<year>/YYYY-MM-DD.csv, one row per drive and day.
+# Failured drives report failure=1 on their last day and are replaced by new drives, as in the BackBlaze dataset.
+# Counters of failing drives grow faster, so KDD rules and collect_data.py windows get realistic inputs.
+# Rows per file are saved to <folder>/_synthetic.json (files starting with '_' are skipped by the scripts).
+MODELS = ['ST4000DM000', 'ST12000NM0007', 'HGST HMS5C4040BLE640', 'ST8000NM0055', 'WDC WD30EFRX']
+SMART_IDS = [1, 3, 4, 5, 7, 9, 10, 12, 187, 188, 189, 190, 192, 193, 194, 197, 198, 199, 240, 241, 242]
+MANIFEST = '_synthetic.json'
+CAPACITY = 4000787030016
+
+
+def get_smart_columns(smart_ids):
+    columns = []
+    for smart_id in smart_ids:
+        columns += ['smart_{}_normalized'.format(smart_id), 'smart_{}_raw'.format(smart_id)]
+    return columns
+
+
+class Fleet(object):
+    def __init__(self, n_drives, models, smart_ids, failure_rate, rng):
+        self.models = np.asarray(models)
+        self.smart_ids = list(smart_ids)
+        self.failure_rate = failure_rate
+        self.rng = rng
+        self.n_created = 0
+        self.serial_numbers = self._new_serial_numbers(n_drives).astype(object)
+        self.drive_models = rng.choice(self.models, n_drives)
+        self.raw = rng.poisson(2, (n_drives, len(self.smart_ids))).astype(np.int64)
+        self.failing = np.zeros(n_drives, dtype=bool)
+
+    def _new_serial_numbers(self, n):
+        serial_numbers = np.char.add('SN', np.arange(self.n_created, self.n_created + n).astype('U12'))
+        self.n_created += n
+        return serial_numbers
+
+    def day(self, date, null_fraction):
+        n = len(self.serial_numbers)
+        rng = self.rng
+        # a failing drive dies within about a month, some drives start to fail every day
+        failure = self.failing & (rng.random(n) < 1 / 30)
+        self.failing |= rng.random(n) < self.failure_rate
+        growth = rng.random(self.raw.shape) < np.where(self.failing, 0.2, 0.002)[:, None]
+        self.raw += growth
+        if 9 in self.smart_ids:  # power-on hours
+            self.raw[:, self.smart_ids.index(9)] += 24
+        normalized = np.clip(100 - self.raw, 1, 100)
+        values = np.empty((n, 2 * len(self.smart_ids)), dtype=np.float64)
+        values[:, 0::2], values[:, 1::2] = normalized, self.raw
+        values[rng.random(values.shape) < null_fraction] = np.nan
+        df = pd.DataFrame(values, columns=get_smart_columns(self.smart_ids)).astype('Int64')
+        df.insert(0, 'failure', failure.astype(int))
+        df.insert(0, 'capacity_bytes', CAPACITY)
+        df.insert(0, 'model', self.drive_models)
+        df.insert(0, 'serial_number', self.serial_numbers)
+        df.insert(0, 'date', date)
+        self._replace(failure)
+        return df
+
+    def _replace(self, failure):
+        n_failed = int(failure.sum())
+        if not n_failed:
+            return
+        self.serial_numbers[failure] = self._new_serial_numbers(n_failed)
+        self.drive_models[failure] = self.rng.choice(self.models, n_failed)
+        self.raw[failure] = self.rng.poisson(2, (n_failed, len(self.smart_ids)))
+        self.failing[failure] = False
+
+
+def generate_dataset(folder, years, days_per_year, n_drives, models=MODELS, smart_ids=SMART_IDS,
+                     failure_rate=0.0001, null_fraction=0.01, seed=17):
+    # failure_rate: a daily probability of a drive to start failing
+    rng = np.random.default_rng(seed)
+    fleet = Fleet(n_drives, models, smart_ids, failure_rate, rng)
+    manifest = {'drives': n_drives, 'models': list(models), 'smart_ids': list(smart_ids), 'seed': seed, 'files': {}}
+    for year in years:
+        year_folder = os.path.join(folder, str(year))
+        os.makedirs(year_folder, exist_ok=True)
+        for date in pd.date_range('{}-01-01'.format(year), periods=days_per_year).strftime('%Y-%m-%d'):
+            filepath = os.path.join(year_folder, date + '.csv')
+            df = fleet.day(date, null_fraction)
+            df.to_csv(filepath, index=False)
+            manifest['files'][os.path.relpath(filepath, folder)] = {'rows': len(df), 'bytes': os.path.getsize(filepath)}
+    with open(os.path.join(folder, MANIFEST), 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def load_manifest(folder):
+    with open(os.path.join(folder, MANIFEST)) as f:
+        return json.load(f)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('--folder', type=str, default='synthetic_data')
+    parser.add_argument('-y', '--year', type=int, action='append', help='2018 by default')
+    parser.add_argument('--days', type=int, default=90, help='days per year')
+    parser.add_argument('--drives', type=int, default=10*1000)
+    parser.add_argument('-m', '--model', type=str, action='append', help='a model mix, models are equally likely')
+    parser.add_argument('--smart', type=int, action='append', help='ids of smart attributes')
+    parser.add_argument('--failure_rate', type=float, default=0.0001, help='daily probability to start failing')
+    parser.add_argument('--null_fraction', type=float, default=0.01)
+    parser.add_argument('--seed', type=int, default=17)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    manifest = generate_dataset(args.folder, args.year or [2018], args.days, args.drives, args.model or MODELS,
+                                args.smart or SMART_IDS, args.failure_rate, args.null_fraction, args.seed)
+    print('files: {}, rows: {}'.format(len(manifest['files']), sum(f['rows'] for f in manifest['files'].values())))
@@ -1,10 +1,16 @@
 import os
 import argparse
 from tqdm import tqdm
+import numpy as np
 import pandas as pd
-import random
-from datetime import datetime, timedelta
-import csv
+from formats import BackgroundWriter, TableWriter, iread_ahead, read_table, text_dates
+from columnar_cache import iget_next_csv, iread_day, read_day_header
+from dataset_files import get_stats_year, set_out_path
+from collect_stats import merge_stats
+from schema import load_schema
+from profiling import PROFILER, profile_run
+from sdfp import add_collect_arguments, check_collect_arguments
+from collections import defaultdict, namedtuple
 
 
 # Lets take data according to these rules:
@@ -12,174 +18,310 @@ import csv
 # Failured serial drives: N days before failure (failures - all)
 # By default N = 120, M = 10k
 
-random.seed(17)
+SEED = 17
 
-
-def get_dirs_with_years(folder):
-    MIN_YEAR, MAX_YEAR = 2010, 3000
-    directories = os.listdir(folder)
-    filtered_dirs = []
-    for d in directories:
-        year = d[-4:]
-        if not year.isdigit():
-            continue
-        year = int(year)
-        if not (MIN_YEAR < year < MAX_YEAR):
-            continue
-        filtered_dirs.append(os.path.join(folder, d))
-    filtered_dirs.sort()
-    return filtered_dirs
-
-
-def iget_next_file(folder, ext=None):
-    if ext is not None:
-        if ext[0] != '.':
-            raise RuntimeError("extention should start with '.'")
-    for dirpath, dnames, fnames in os.walk(folder):
-        for filename in fnames:
-            if filename[0] in ['_', '.']:
-                continue
-            if ext is not None and filename[-len(ext):] != ext:
-                continue
-            yield filename, os.path.join(dirpath, filename)
-
-
-def iget_next_csv(folder):
-    years_directories = get_dirs_with_years(folder)  # sorted by year
-    years_directories = years_directories if years_directories else [folder]
-    for year_path in years_directories:
-        yield from sorted(list(iget_next_file(year_path, '.csv')))
+# failured_sns, healthy_sns: DataFrame(serial_number, start, end) of [start, end] windows (datetime64[D]),
+# year=None matches files of any year
+DumpJob = namedtuple('DumpJob', ['model', 'year', 'out_path', 'failured_sns', 'healthy_sns'])
 
 
 def get_all_csvs(folder):
     return list(iget_next_csv(folder))
 
 
-def convert_str2date(line):
-    return datetime.strptime(line, "%Y-%m-%d")
-
+def get_date_index(folder):
+    # daily files are named by date: YYYY-MM-DD.csv, files with other names get NaT
+    files = get_all_csvs(folder)
+    return pd.DataFrame({
+        'date': pd.to_datetime([csv_filename[:10] for csv_filename, _ in files], format='%Y-%m-%d', errors='coerce'),
+        'year': pd.Series([int(csv_filename[:4]) if csv_filename[:4].isdigit() else None for csv_filename, _ in files],
+                          dtype=object),
+        'filename': [csv_filename for csv_filename, _ in files],
+        'path': [csv_filepath for _, csv_filepath in files],
+    })
+
+
+def merge_intervals(starts, ends):
+    # union of [start, end] intervals as sorted disjoint intervals
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] > ends[:-1]
+    last = np.append(first[1:], True)
+    return starts[first], ends[last]
+
+
+def in_intervals(dates, starts, ends):
+    idx = np.searchsorted(starts, dates, side='right') - 1
+    return (idx >= 0) & (dates <= ends[np.maximum(idx, 0)])
+
+
+def select_files(date_index, jobs):
+    # [(filename, path, year)] of files with a date inside a window of a job for the year of the file,
+    # files without a date are kept, year is None for files without a year
+    dates = date_index['date'].values.astype('datetime64[D]')
+    selected = np.isnat(dates)
+    for year in set(job.year for job in jobs):
+        tables = [sns for job in jobs if job.year == year for sns in (job.failured_sns, job.healthy_sns)]
+        starts = np.concatenate([sns['start'].values.astype('datetime64[D]') for sns in tables])
+        ends = np.concatenate([sns['end'].values.astype('datetime64[D]') for sns in tables])
+        if not len(starts):  # no drives with windows for the year
+            continue
+        of_year = np.ones(len(dates), dtype=bool) if year is None else (date_index['year'] == year).values
+        selected |= of_year & in_intervals(dates, *merge_intervals(starts, ends))
+    return list(date_index.loc[selected, ['filename', 'path', 'year']].itertuples(index=False, name=None))
 
-def convert_date2str(d):
-    return d.strftime("%Y-%m-%d")
 
+def to_days(dates):
+    return pd.to_datetime(dates, format='%Y-%m-%d').values.astype('datetime64[D]')
 
-def get_available_serial_numbers(stats_path, model, history, health_drives_count):
-    def remove_days(date: str, days: int):
-        date = convert_str2date(date)
-        return convert_date2str(date - timedelta(days=days))
 
-    df = pd.read_csv(stats_path)
+def select_model_stats(df, model):
+    df = text_dates(df)
+    df['failure'] = df['failure'].astype(bool)
     df = df[(df.model == model) & (~df.failure | (df.failure_date == df.last_time_seen))]
-    df['lifetime_days'] = (df.last_time_seen.apply(convert_str2date) - df.first_time_seen.apply(convert_str2date)).apply(lambda x: x.days) + 1
-    df = df[df.lifetime_days >= history]
-    # all failured drives
-    df_failured = df[df.failure]
-    df_healthy = df[~df.failure]
-    # form failured serial numbers
-    df_failured_serial_numbers = {
-        sn: (remove_days(last_date, history-1), remove_days(last_date, -1))  # [) interval
-        for sn, last_date in df_failured[['serial_number', 'last_time_seen']].values
-    }
-    df_failured_serial_numbers_count = len(df_failured_serial_numbers)
-    # form healthy serial numbers
-    if health_drives_count < df_healthy.shape[0]:
-        df_healthy = df_healthy.sample(health_drives_count)
-
-    def choose_start_date(obj):
-        first_date, lifetime_days = convert_str2date(obj['first_time_seen']), obj['lifetime_days']
-        shift_end = lifetime_days - history - 1
-        if shift_end < 0:
-            raise RuntimeError("Count of days is too small")
-        shift_in_days = random.randint(0, shift_end)
-        return convert_date2str(first_date + timedelta(days=shift_in_days))
-
-    def form_interval(row):
-        start_date = choose_start_date(row)
-        end_date = remove_days(start_date, -history)
-        return start_date, end_date
-
-    df_healthy_serial_numbers = {}
-    for _, row in df_healthy.iterrows():
-        try:
-            sn = row['serial_number']
-            df_healthy_serial_numbers[sn] = form_interval(row)
-        except RuntimeError:
-            pass
-
-    return df_failured_serial_numbers, df_healthy_serial_numbers
-
-
-def set_out_path(model, year=None):
-    year = str(year)+'_' if year else ''
-    return 'model_{}{}.csv'.format(year, model)
-
-
-def dump_data(in_path, out_path, failured_sns, healthy_sns):
-    sns = {**failured_sns, **healthy_sns}
-
-    def valid_row(row):
-        serial_number = row['serial_number']
-        if serial_number not in sns:
-            return False
-        start, end = sns[serial_number]
-        return start <= row['date'] <= end
-
-    header = None
-    count = 0
-    with open(out_path, 'w') as out_csv:
-        csv_writer = None
-        # get_all_csvs instead of iget_next_csv to show a progress bar with %
-        for _, csv_filepath in tqdm(get_all_csvs(in_path), desc='Iterate through files in {}'.format(in_path)):
-            with open(csv_filepath) as inp_csv:
-                csv_reader = csv.DictReader(inp_csv)
-                for row in csv_reader:
-                    if csv_writer:
-                        if not valid_row(row):
-                            continue
-                        row['failure'] = int(row['serial_number'] in failured_sns)
-                        # filter new columns
-                        row = {key: value for key, value in row.items() if key in header}
-                        csv_writer.writerow(row)
-                        count += 1
-                        continue
-                    header = row.keys()
-                    csv_writer = csv.DictWriter(out_csv, fieldnames=header)
-                    csv_writer.writeheader()
-    print('Dump data into: {}, (size: {})'.format(out_path, count))
-
-
-def collect_data(in_path, stats_path, out_path, model, history, health_drives_count):
+    return pd.DataFrame({
+        'serial_number': df['serial_number'].values,
+        'first_time_seen': to_days(df['first_time_seen']),
+        'last_time_seen': to_days(df['last_time_seen']),
+        'failure': df['failure'].values,
+    })
+
+
+def load_model_stats(stats_path, model):
+    with PROFILER.phase('load_stats', stats_path):
+        return select_model_stats(read_table(stats_path), model)
+
+
+def load_lifetime_stats(stats_paths, model):
+    # stats of several years are merged per drive, so windows of a drive can span years
+    frames = []
+    for stats_path in stats_paths:
+        with PROFILER.phase('load_stats', stats_path):
+            df = read_table(stats_path)
+            frames.append(df[df['model'] == model])
+            del df
+    with PROFILER.phase('merge_stats'):
+        return select_model_stats(merge_stats(frames), model)
+
+
+def plan_windows(df, histories, health_drives_count, seed=SEED):
+    # df: load_model_stats, returns {history: (failured windows, healthy windows)}.
+    # Random draws are made once for all drives, so a seed gives the same windows of a history
+    # regardless of other requested histories
+    rng = np.random.default_rng(seed)
+    priority = rng.random(len(df))  # healthy drives with the smallest priority are sampled
+    offset = rng.random(len(df))  # start of a healthy window as a fraction of possible shifts
+    first_seen = df['first_time_seen'].values.astype('datetime64[D]')
+    last_seen = df['last_time_seen'].values.astype('datetime64[D]')
+    lifetime_days = (last_seen - first_seen).astype(np.int64) + 1
+    failure = df['failure'].values
+    windows = {}
+    for history in histories:
+        available = lifetime_days >= history
+        # all failured drives: history days before failure
+        failured = np.flatnonzero(available & failure)
+        failured_windows = pd.DataFrame({
+            'serial_number': df['serial_number'].values[failured],
+            'start': last_seen[failured] - np.timedelta64(history - 1, 'D'),
+            'end': last_seen[failured] + np.timedelta64(1, 'D'),
+        })
+        # healthy drives: history days from a random start date
+        healthy = np.flatnonzero(available & ~failure)
+        if health_drives_count < len(healthy):
+            healthy = np.sort(healthy[np.argsort(priority[healthy], kind='stable')[:health_drives_count]])
+        shift_end = lifetime_days[healthy] - history - 1
+        healthy, shift_end = healthy[shift_end >= 0], shift_end[shift_end >= 0]
+        start = first_seen[healthy] + (offset[healthy] * (shift_end + 1)).astype(np.int64).astype('timedelta64[D]')
+        healthy_windows = pd.DataFrame({
+            'serial_number': df['serial_number'].values[healthy],
+            'start': start,
+            'end': start + np.timedelta64(history, 'D'),
+        })
+        windows[history] = (failured_windows, healthy_windows)
+    return windows
+
+
+def get_available_serial_numbers(stats_path, model, history, health_drives_count, seed=SEED):
+    df = load_model_stats(stats_path, model)
+    with PROFILER.phase('plan'):
+        return plan_windows(df, [history], health_drives_count, seed)[history]
+
+
+def build_windows(jobs):
+    # {year: DataFrame(serial_number, _job_idx, _start, _end, _failure)}, windows are [start, end]
+    windows = defaultdict(list)
+    for job_idx, job in enumerate(jobs):
+        for sns, failure in [(job.failured_sns, 1), (job.healthy_sns, 0)]:
+            windows[job.year].append(pd.DataFrame({
+                'serial_number': sns['serial_number'].values,
+                '_job_idx': job_idx,
+                '_start': sns['start'].values.astype('datetime64[D]').astype(str),  # dates of rows are text
+                '_end': sns['end'].values.astype('datetime64[D]').astype(str),
+                '_failure': failure,
+            }))
+    # a serial number in both tables is a healthy one
+    return {year: pd.concat(tables, ignore_index=True).drop_duplicates(['_job_idx', 'serial_number'], keep='last')
+            for year, tables in windows.items()}
+
+
+def read_day_chunks(csv_filepath, chunksize, columns=None):
+    # header and text chunks of a daily file, runs in read-ahead threads. columns: a projection
+    with PROFILER.phase('read', csv_filepath):
+        header = read_day_header(csv_filepath)
+        if columns is not None:
+            header = [column for column in header if column in columns]
+        return header, list(iread_day(csv_filepath, header if columns else None, text=True, chunksize=chunksize))
+
+
+def get_schema_headers(in_path, jobs, files):
+    # populated columns of a job model in years of the job from a schema registry which has all files, or None
+    schema = load_schema(in_path)
+    if schema is None or not all(schema.has_file(csv_filename) for csv_filename, _, _ in files):
+        return None, None
+    files_years = sorted({year for _, _, year in files if year is not None})
+    headers, dtypes = [], []
+    for job in jobs:
+        years = files_years if job.year is None else [job.year]
+        models = None if job.model is None else [job.model]
+        headers.append(schema.columns(years, models))
+        dtypes.append(schema.dtypes(years, models, headers[-1]))
+    return headers, dtypes
+
+
+def dump_data_multi(in_path, jobs, chunksize=256*1024, read_ahead=2, background_writers=True):
+    # one pass through daily files, every chunk of a file is joined with windows of all jobs.
+    # read_ahead: threads reading next files while the current one is joined (0 - no threads),
+    # background_writers: outputs are written by their own threads
+    windows = build_windows(jobs)
+    counts = [0] * len(jobs)
+    writers = [None] * len(jobs)  # csv or parquet by extension of out_path
+
+    def open_writer(job_idx, header):
+        headers[job_idx] = headers[job_idx] or header
+        writer = TableWriter(jobs[job_idx].out_path, headers[job_idx], dtypes=dtypes and dtypes[job_idx])
+        writers[job_idx] = BackgroundWriter(writer) if background_writers else writer
+    try:
+        # only files inside of requested windows are read
+        files = [file for file in select_files(get_date_index(in_path), jobs) if file[2] in windows or None in windows]
+        # with a schema registry outputs have populated columns of their models, only these columns are read.
+        # Otherwise the header of the first file of a job is used, new columns are filtered
+        headers, dtypes = get_schema_headers(in_path, jobs, files)
+        columns = None
+        if headers is not None:
+            columns = {year: {column for job_idx, job in enumerate(jobs) if job.year in (year, None)
+                              for column in headers[job_idx]} for year in {year for _, _, year in files}}
+        headers = headers or [None] * len(jobs)
+        first_header = None
+        days = iread_ahead(lambda file: read_day_chunks(file[1], chunksize, columns and columns[file[2]]),
+                           files, read_ahead)
+        for (csv_filename, csv_filepath, year), (header, chunks) in tqdm(
+                days, total=len(files), desc='Iterate through files in {}'.format(in_path)):
+            # files without a year are joined with windows of any year only
+            keys = (year, None) if year is not None else (None,)
+            year_windows = pd.concat([windows[key] for key in keys if key in windows], ignore_index=True)
+            first_header = first_header or header
+            for job_idx in year_windows['_job_idx'].unique():
+                if writers[job_idx] is None:
+                    open_writer(job_idx, header)
+            # values are kept as text to write them back unchanged, columns out of a header are dropped by writers
+            for chunk in chunks:
+                with PROFILER.phase('join', csv_filepath):
+                    rows = chunk.merge(year_windows, on='serial_number', how='inner')  # keeps order of rows in a file
+                    rows = rows[(rows['_start'] <= rows['date']) & (rows['date'] <= rows['_end'])]
+                    rows = rows.assign(failure=rows['_failure'])
+                PROFILER.count(csv_filepath, rows_read=len(chunk), rows_kept=len(rows))
+                for job_idx, job_rows in rows.groupby('_job_idx', sort=False):
+                    writers[job_idx].write(job_rows)
+                    counts[job_idx] += len(job_rows)
+            del chunks
+        # jobs without windows or rows get an empty output with a header
+        for job_idx, writer in enumerate(writers):
+            if writer is None:
+                if not headers[job_idx] and not first_header:
+                    first_header = read_day_header(next(iget_next_csv(in_path))[1])
+                open_writer(job_idx, first_header)
+    finally:
+        for writer in writers:
+            if writer:
+                writer.close()
+    for job, count in zip(jobs, counts):
+        print('Dump data into: {}, (size: {})'.format(job.out_path, count))
+
+
+def dump_data(in_path, out_path, failured_sns, healthy_sns, read_ahead=2, model=None):
+    dump_data_multi(in_path, [DumpJob(model, None, out_path, failured_sns, healthy_sns)], read_ahead=read_ahead)
+
+
+def collect_data(in_path, stats_path, out_path, model, history, health_drives_count, read_ahead=2):
     if not os.path.isdir(in_path):
         RuntimeError('Input filepath should be folder, got: {}'.format(in_path))
     failured_sns, healthy_sns = get_available_serial_numbers(stats_path, model, history, health_drives_count)
-    dump_data(in_path, out_path, failured_sns, healthy_sns)
+    dump_data(in_path, out_path, failured_sns, healthy_sns, read_ahead, model)
+
+
+def collect_data_multi(in_path, stats_paths, out_folder, models, histories, health_drives_count, fmt='csv',
+                       read_ahead=2):
+    # every (stats file, model, history) is a separate output, all of them are filled in one pass
+    if not os.path.isdir(in_path):
+        raise RuntimeError('Input filepath should be folder, got: {}'.format(in_path))
+    jobs = []
+    for stats_path in stats_paths:
+        year = get_stats_year(stats_path)
+        for model in models:
+            df = load_model_stats(stats_path, model)
+            with PROFILER.phase('plan'):
+                windows = plan_windows(df, histories, health_drives_count)
+            for history, (failured_sns, healthy_sns) in windows.items():
+                out_name = set_out_path(model, year, fmt, history if len(histories) > 1 else None)
+                jobs.append(DumpJob(model, year, os.path.join(out_folder, out_name), failured_sns, healthy_sns))
+    dump_data_multi(in_path, jobs, read_ahead=read_ahead)
+
+
+def collect_data_cross_year(in_path, stats_paths, out_path, models, histories, health_drives_count, fmt='csv',
+                            read_ahead=2):
+    # in_path: a folder with all years, files of all years are read as one stream ordered by date
+    if not os.path.isdir(in_path):
+        raise RuntimeError('Input filepath should be folder, got: {}'.format(in_path))
+    jobs = []
+    multi = len(models) > 1 or len(histories) > 1  # out_path is a folder
+    for model in models:
+        df = load_lifetime_stats(stats_paths, model)
+        with PROFILER.phase('plan'):
+            windows = plan_windows(df, histories, health_drives_count)
+        for history, (failured_sns, healthy_sns) in windows.items():
+            out_name = set_out_path(model, None, fmt, history if len(histories) > 1 else None)
+            filepath = os.path.join(out_path, out_name) if multi else out_path
+            jobs.append(DumpJob(model, None, filepath, failured_sns, healthy_sns))
+    dump_data_multi(in_path, jobs, read_ahead=read_ahead)
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Process arguments')
-    parser.add_argument('--path', type=str, required=True)
-    parser.add_argument('--stats', type=str, required=True)
-    parser.add_argument('--out', type=str, default=None)
-
-    parser.add_argument('--model', type=str, default='ST4000DM000')
-    parser.add_argument('--days_before', type=int, default=120)
-    parser.add_argument('--health_drives', type=int, default=10*1000)
+    add_collect_arguments(parser)
     return parser.parse_args()
 
 
 def check_args(args):
-    # try to find a year in stats filepath in format: stats_2016.csv
-    try:
-        year = int(args.stats[-8:-4])
-    except ValueError:
-        year = None
-    out_path = set_out_path(args.model, year) if args.out is None else args.out
-    args.out = out_path
+    check_collect_arguments(args)
+
+
+def main(args):
+    with profile_run(args.profile, args.cprofile):
+        if args.cross_year:
+            collect_data_cross_year(args.path, args.stats, args.out,
+                args.model, args.days_before, args.health_drives, args.format, args.read_ahead)
+        elif args.multi:
+            collect_data_multi(args.path, args.stats, args.out,
+                args.model, args.days_before, args.health_drives, args.format, args.read_ahead)
+        else:
+            collect_data(args.path, args.stats[0], args.out,
+                args.model[0], args.days_before[0], args.health_drives, args.read_ahead)
 
 
 if __name__ == '__main__':
     args = parse_arguments()
     check_args(args)
-    collect_data(args.path, args.stats, args.out,
-        args.model, args.days_before, args.health_drives)
-
+    main(args)
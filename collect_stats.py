@@ -1,27 +1,28 @@
 import os
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 from collections import defaultdict, namedtuple
+import numpy as np
 import pandas as pd
+from stats_store import StatsStore
+from formats import iread_ahead, text_dates, with_format, write_table
+from columnar_cache import iget_next_csv, read_day
+from schema import get_day_dtypes
+from profiling import PROFILER, profile_run
+from sdfp import add_stats_arguments, check_stats_arguments
 
 
-YearPath = namedtuple('YearPath', ['year', 'path'])
+ModelSummary = namedtuple('ModelSummary', ['model', 'n_serial_numbers', 'n_failures'])
 
-
-def iget_next_file(folder, ext=None):
-    if ext is not None:
-        if ext[0] != '.':
-            raise RuntimeError("extention should start with '.'")
-    for dirpath, dnames, fnames in os.walk(folder):
-        for filename in fnames:
-            if filename[0] in ['_', '.']:
-                continue
-            if ext is not None and filename[-len(ext):] != ext:
-                continue
-            yield filename, os.path.join(dirpath, filename)
+STATS_COLUMNS = ['date', 'serial_number', 'model', 'failure']
+NO_DATE = np.iinfo(np.int32).min  # failure_date placeholder for healthy drives
+ORDER_STRIDE = 1 << 32  # order = file_idx * ORDER_STRIDE + row_idx
 
 
 class SerialNumber(object):
+    __slots__ = ['serial_number', 'first_seen', 'last_seen', 'failure', 'failure_date']
+
     def __init__(self, serial_number, first_seen):
         self.serial_number = serial_number
         self.last_seen = self.first_seen = first_seen
@@ -80,43 +81,447 @@ class SDStats(object):
         sorted_model_buckets = sorted(sorted_model_buckets, key=lambda x: x[0], reverse=True)
         return list(zip(*sorted_model_buckets[:5]))[1]
 
+    def to_frame(self, year):
+        rows = []
+        for model, model_bucket in self.model_buckets.items():
+            for serial_number, sn_obj in model_bucket.serial_numbers.items():
+                rows.append({
+                    'year': year,
+                    'model': model,
+                    'serial_number': serial_number,
+                    'first_time_seen': sn_obj.first_seen,
+                    'last_time_seen': sn_obj.last_seen,
+                    'failure': sn_obj.failure,
+                    'failure_date': sn_obj.failure_date
+                })
+        return pd.DataFrame(rows)
+
+
+LIFETIME_BUCKETS = [30, 90, 180, 270]  # days, strata of healthy samples together with first seen quarters
+
+
+class DriveReservoir(object):
+    """
+    Bottom-k sample of drives of one model: drives with the smallest hashed priorities, sorted by serial number.
+    The threshold only decreases, so a drive is either kept from its first day or never gets in:
+    first and last seen dates of kept drives are exact.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.threshold = np.iinfo(np.uint64).max
+        self.serial_numbers = np.empty(0, dtype=object)
+        self.priorities = np.empty(0, dtype=np.uint64)
+        self.first_seen = np.empty(0, dtype=np.int32)
+        self.last_seen = np.empty(0, dtype=np.int32)
+        self.failed = np.empty(0, dtype=bool)
+
+    def add(self, serial_numbers, priorities, dates, failures):
+        # the drive with the threshold priority is kept, so it gets updates as well
+        rows = priorities <= self.threshold
+        rows[rows] = ~pd.Series(serial_numbers[rows]).duplicated().values  # the first row of a drive in a day
+        serial_numbers, priorities, dates, failures = \
+            serial_numbers[rows], priorities[rows], dates[rows], failures[rows]
+        pos = np.searchsorted(self.serial_numbers, serial_numbers)
+        found = pos < len(self.serial_numbers)
+        found[found] = self.serial_numbers[pos[found]] == serial_numbers[found]
+        self.last_seen[pos[found]] = np.maximum(self.last_seen[pos[found]], dates[found])
+        self.failed[pos[found]] |= failures[found]
+        # failured drives keep their places, so the sample of all drives stays uniform
+        new = ~found & (priorities < self.threshold)
+        self.serial_numbers = np.concatenate([self.serial_numbers, serial_numbers[new]])
+        self.priorities = np.concatenate([self.priorities, priorities[new]])
+        self.first_seen = np.concatenate([self.first_seen, dates[new]])
+        self.last_seen = np.concatenate([self.last_seen, dates[new]])
+        self.failed = np.concatenate([self.failed, failures[new]])
+        keep = np.arange(len(self.priorities))
+        if len(keep) > self.capacity:
+            keep = np.argpartition(self.priorities, self.capacity - 1)[:self.capacity]
+            self.threshold = self.priorities[keep].max()
+        keep = keep[np.argsort(self.serial_numbers[keep], kind='stable')]
+        for name in ['serial_numbers', 'priorities', 'first_seen', 'last_seen', 'failed']:
+            setattr(self, name, getattr(self, name)[keep])
+
+
+def allocate(counts, size):
+    # proportional allocation of size between strata, the largest remainders get the rest
+    quotas = counts * min(size, counts.sum()) / max(counts.sum(), 1)
+    allocation = np.floor(quotas).astype(np.int64)
+    rest = int(min(size, counts.sum()) - allocation.sum())
+    allocation[np.argsort(allocation - quotas, kind='stable')[:rest]] += 1
+    return allocation
+
+
+class HealthySampler(object):
+    """
+    Per model sample of healthy drives, collected online during the stats pass.
+    Reservoirs keep oversample * size drives, at the end healthy drives living more than min_days
+    are stratified by lifetime and first seen quarter and size drives are taken proportionally.
+    """
+    def __init__(self, size, min_days=0, oversample=4, seed=17):
+        self.size = size
+        self.min_days = min_days
+        self.capacity = size * oversample
+        self._hash_key = '{:016d}'.format(seed)
+        self._reservoirs = {}
+
+    def add_day(self, df):
+        codes, models = pd.factorize(df['model'])
+        serial_numbers = df['serial_number'].to_numpy(dtype=object)
+        priorities = pd.util.hash_array(serial_numbers, hash_key=self._hash_key)
+        dates = dates_to_days(df['date'])
+        failures = df['failure'].values.astype(bool)
+        for code, model in enumerate(models):
+            if model not in self._reservoirs:
+                self._reservoirs[model] = DriveReservoir(self.capacity)
+            rows = codes == code
+            self._reservoirs[model].add(serial_numbers[rows], priorities[rows], dates[rows], failures[rows])
+
+    def _sample_model(self, reservoir):
+        lifetime_days = reservoir.last_seen.astype(np.int64) - reservoir.first_seen + 1
+        healthy = np.flatnonzero(~reservoir.failed & (lifetime_days > self.min_days))
+        quarters = reservoir.first_seen[healthy].astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) // 3
+        strata = quarters * (len(LIFETIME_BUCKETS) + 1) + np.digitize(lifetime_days[healthy], LIFETIME_BUCKETS)
+        _, stratum_ids, counts = np.unique(strata, return_inverse=True, return_counts=True)
+        allocation = allocate(counts, self.size)
+        # drives with the smallest priorities of every stratum
+        order = np.lexsort((reservoir.priorities[healthy], stratum_ids))
+        rank = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.sort(healthy[order[rank < allocation[stratum_ids[order]]]])
+
+    def to_frame(self, year):
+        frames = []
+        for model, reservoir in self._reservoirs.items():
+            ids = self._sample_model(reservoir)
+            frames.append(pd.DataFrame({
+                'year': year,
+                'model': model,
+                'serial_number': reservoir.serial_numbers[ids].astype(str),
+                'first_time_seen': days_to_dates(reservoir.first_seen[ids]),
+                'last_time_seen': days_to_dates(reservoir.last_seen[ids]),
+                'failure': False,
+                'failure_date': None,
+            }))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def dates_to_days(dates):
+    return pd.to_datetime(dates, format='%Y-%m-%d').values.astype('datetime64[D]').astype(np.int32)
+
+
+def days_to_dates(days):
+    return days.astype('datetime64[D]').astype(str)
+
+
+def reduce_aggregates(table):
+    # table: rows of partial aggregates with (model, serial_number) keys, may contain duplicates.
+    # Every reduction is associative, so partial aggregates can be merged in any grouping
+    table = table.sort_values('order', kind='stable')
+    return table.groupby(['model', 'serial_number'], sort=False, observed=True).agg(
+        order=('order', 'min'),
+        first_seen=('first_seen', 'min'),
+        last_seen=('last_seen', 'max'),
+        n_failures=('n_failures', 'sum'),
+        first_failure=('first_failure', 'first'),  # failure flag of the very first row
+        failure_date=('failure_date', 'max'),
+    ).reset_index()
+
+
+def aggregate_day(df, file_idx):
+    dates = dates_to_days(df['date'])
+    failure = df['failure'].values.astype(bool)
+    table = pd.DataFrame({
+        'model': df['model'].values,
+        'serial_number': df['serial_number'].values,
+        'order': file_idx * ORDER_STRIDE + np.arange(len(df), dtype=np.int64),
+        'first_seen': dates,
+        'last_seen': dates,
+        'n_failures': failure.astype(np.int32),
+        'first_failure': failure,
+        'failure_date': np.where(failure, dates, NO_DATE).astype(np.int32),
+    })
+    return reduce_aggregates(table)
+
+
+def grow(array, size):
+    # capacity grows by 1.5 to keep appends amortized O(1)
+    if size <= len(array):
+        return array
+    grown = np.empty(max(size, len(array) * 3 // 2), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class CompactModelBucket(object):
+    """
+    ModelBucket with per drive state in numpy arrays, the id of a serial number is its position in arrays.
+    Dates are int32 day ordinals, serial numbers are fixed width bytes found with a sorted index.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.n_serial_numbers = 0
+        self.n_failures = 0
+        self._serial_numbers = np.empty(0, dtype='S1')
+        self._first_seen = np.empty(0, dtype=np.int32)
+        self._last_seen = np.empty(0, dtype=np.int32)
+        self._failure_date = np.empty(0, dtype=np.int32)
+        self._sorted_ids = np.empty(0, dtype=np.int32)
+
+    def _lookup(self, serial_numbers):
+        n = self.n_serial_numbers
+        if n == 0:
+            return np.zeros(len(serial_numbers), dtype=np.int32), np.zeros(len(serial_numbers), dtype=bool)
+        pos = np.searchsorted(self._serial_numbers[:n], serial_numbers, sorter=self._sorted_ids)
+        ids = self._sorted_ids[np.minimum(pos, n - 1)]
+        return ids, self._serial_numbers[ids] == serial_numbers
+
+    def _append(self, serial_numbers, dates):
+        start, end = self.n_serial_numbers, self.n_serial_numbers + len(serial_numbers)
+        self._serial_numbers = grow(self._serial_numbers, end)
+        self._first_seen = grow(self._first_seen, end)
+        self._last_seen = grow(self._last_seen, end)
+        self._failure_date = grow(self._failure_date, end)
+        self._serial_numbers[start:end] = serial_numbers
+        self._first_seen[start:end] = self._last_seen[start:end] = dates
+        self._failure_date[start:end] = NO_DATE
+        self.n_serial_numbers = end
+        self._sorted_ids = np.argsort(self._serial_numbers[:end], kind='stable').astype(np.int32)
+
+    def _add_unique(self, serial_numbers, dates, failures):
+        ids, found = self._lookup(serial_numbers)
+        self._last_seen[ids[found]] = dates[found]
+        failed = found & failures
+        self._failure_date[ids[failed]] = dates[failed]
+        self.n_failures += int(failed.sum())
+        # as in ModelBucket, the failure flag of the first row of a serial number is skipped
+        self._append(serial_numbers[~found], dates[~found])
+
+    def add(self, serial_numbers, dates, failures):
+        # rows with a repeated serial number are applied in the next round to keep the order of updates
+        if serial_numbers.itemsize > self._serial_numbers.itemsize:
+            self._serial_numbers = self._serial_numbers.astype(serial_numbers.dtype)
+        while len(serial_numbers):
+            _, first = np.unique(serial_numbers, return_index=True)
+            first = np.sort(first)
+            self._add_unique(serial_numbers[first], dates[first], failures[first])
+            rest = np.ones(len(serial_numbers), dtype=bool)
+            rest[first] = False
+            serial_numbers, dates, failures = serial_numbers[rest], dates[rest], failures[rest]
+
+    def to_frame(self, year):
+        n = self.n_serial_numbers
+        failure = self._failure_date[:n] != NO_DATE
+        failure_date = days_to_dates(self._failure_date[:n]).astype(object)
+        failure_date[~failure] = None
+        return pd.DataFrame({
+            'year': year,
+            'model': self.model,
+            'serial_number': np.char.decode(self._serial_numbers[:n], 'utf-8'),
+            'first_time_seen': days_to_dates(self._first_seen[:n]),
+            'last_time_seen': days_to_dates(self._last_seen[:n]),
+            'failure': failure,
+            'failure_date': failure_date,
+        })
+
+
+class CompactSDStats(object):
+    """
+    SDStats with CompactModelBucket, rows are added by daily files
+    """
+    def __init__(self):
+        self.model_buckets = {}
 
-def get_dirs_with_years(folder):
-    MIN_YEAR, MAX_YEAR = 2010, 3000
-    directories = os.listdir(folder)
-    filtered_dirs = []
-    for d in directories:
-        year = d[-4:]
-        if not year.isdigit():
-            continue
-        year = int(year)
-        if not (MIN_YEAR < year < MAX_YEAR):
-            continue
-        filtered_dirs.append(YearPath(year, os.path.join(folder, d)))
-    filtered_dirs.sort()
-    return filtered_dirs
+    @property
+    def n_models(self):
+        return len(self.model_buckets)
+
+    def add_day(self, df, file_idx=None):
+        codes, models = pd.factorize(df['model'])  # models in order of appearance
+        serial_numbers = df['serial_number'].str.encode('utf-8').values.astype(bytes)
+        dates = dates_to_days(df['date'])
+        failures = df['failure'].values.astype(bool)
+        for code, model in enumerate(models):
+            if model not in self.model_buckets:
+                self.model_buckets[model] = CompactModelBucket(model)
+            rows = codes == code
+            self.model_buckets[model].add(serial_numbers[rows], dates[rows], failures[rows])
 
+    def most_unreliable(self, n=5):
+        return sorted(self.model_buckets.values(), key=lambda x: x.n_failures, reverse=True)[:n]
 
-def iget_next_csv(folder):
-    years_directories = get_dirs_with_years(folder)  # sorted by year
-    for year_path in years_directories:
-        yield from sorted(list(iget_next_file(year_path.path, '.csv')))
+    def to_frame(self, year):
+        if not self.model_buckets:
+            return pd.DataFrame()
+        return pd.concat([bucket.to_frame(year) for bucket in self.model_buckets.values()], ignore_index=True)
 
 
-def icollect_stats(folder, years=None):
-    # year, model, serial_number, first_time_seen, last_time_seen, failure, failure_date
-    current_year, stats_by_year = None, SDStats()
-    for csv_filename, csv_filepath in tqdm(iget_next_csv(folder)):
+class ColumnarSDStats(object):
+    """
+    Same stats as SDStats, but kept as one table of per drive aggregates.
+    Daily files are reduced with groupby and merged into the table instead of row by row updates.
+    """
+    def __init__(self, table=None):
+        self.table = table
+
+    @property
+    def n_models(self):
+        return 0 if self.table is None else self.table['model'].nunique()
+
+    def add_day(self, df, file_idx):
+        self.merge(aggregate_day(df, file_idx))
+
+    def merge(self, other):
+        other = other.table if isinstance(other, ColumnarSDStats) else other
+        if other is None:
+            return self
+        if self.table is None:
+            self.table = other
+        else:
+            self.table = reduce_aggregates(pd.concat([self.table, other], ignore_index=True))
+        return self
+
+    def _finalized(self):
+        # SDStats skips the failure flag of the first row of every serial number
+        table = self.table.copy()
+        table['n_failures'] = table['n_failures'] - table['first_failure'].astype(np.int32)
+        table['failure'] = table['n_failures'] > 0
+        # SDStats keeps models and serial numbers in order of appearance
+        table['model_order'] = table.groupby('model', sort=False)['order'].transform('min')
+        return table.sort_values(['model_order', 'order'], kind='stable')
+
+    def most_unreliable(self, n=5):
+        if self.table is None:
+            return []
+        grouped = self._finalized().groupby('model', sort=False)
+        summary = pd.DataFrame({
+            'n_serial_numbers': grouped.size(),
+            'n_failures': grouped['n_failures'].sum(),
+        }).sort_values('n_failures', ascending=False, kind='stable')
+        return [ModelSummary(model, int(row.n_serial_numbers), int(row.n_failures))
+                for model, row in summary.head(n).iterrows()]
+
+    def to_frame(self, year):
+        if self.table is None:
+            return pd.DataFrame()
+        table = self._finalized()
+        failure_date = days_to_dates(table['failure_date'].values).astype(object)
+        failure_date[~table['failure'].values] = None
+        return pd.DataFrame({
+            'year': year,
+            'model': table['model'].values,
+            'serial_number': table['serial_number'].values,
+            'first_time_seen': days_to_dates(table['first_seen'].values),
+            'last_time_seen': days_to_dates(table['last_seen'].values),
+            'failure': table['failure'].values,
+            'failure_date': failure_date,
+        })
+
+
+def read_stats_columns(csv_filepath):
+    # compact types of a schema registry: categorical models, int8 failures
+    return read_day(csv_filepath, STATS_COLUMNS, dtypes=get_day_dtypes(csv_filepath, STATS_COLUMNS))
+
+
+def iget_files_by_year(folder, years=None):
+    # yields (year, [(file_idx, csv_filepath), ...]), file_idx is a global position of the file
+    current_year, files = None, []
+    for file_idx, (csv_filename, csv_filepath) in enumerate(iget_next_csv(folder)):
         year = int(csv_filename[:4])
         if years and (year not in years):
             continue
+        if current_year is not None and year != current_year:
+            yield current_year, files
+            files = []
+        current_year = year
+        files.append((file_idx, csv_filepath))
+    if files:
+        yield current_year, files
+
+
+def collect_partial_stats(files):
+    stats = ColumnarSDStats()
+    for file_idx, csv_filepath in files:
+        stats.add_day(read_stats_columns(csv_filepath), file_idx)
+    return stats.table
+
+
+def split_into_chunks(items, n_chunks):
+    chunk_size = max(1, -(-len(items) // n_chunks))
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def icollect_stats_parallel(folder, years=None, workers=2, chunks_per_worker=4):
+    # map: every worker reduces a contiguous chunk of daily files of one year
+    # reduce: the parent merges partial aggregates, years are yielded in order
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for year, files in iget_files_by_year(folder, years):
+            chunks = split_into_chunks(files, workers * chunks_per_worker)
+            stats_by_year = ColumnarSDStats()
+            for table in tqdm(executor.map(collect_partial_stats, chunks), total=len(chunks),
+                              desc='Collect stats for {}'.format(year)):
+                stats_by_year.merge(table)
+            yield year, stats_by_year
+
+
+def file_day(csv_filepath):
+    # daily files are named by date: YYYY-MM-DD.csv
+    return int(dates_to_days([os.path.basename(csv_filepath)[:10]])[0])
+
+
+def icollect_stats_incremental(folder, store_path, years=None, workers=1):
+    # only files which are not in the store yet are read, every chunk of files is a checkpoint.
+    # file_idx is a date of the file to keep the order of appearance stable between runs
+    store = StatsStore(store_path)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for year, files in iget_files_by_year(folder, years):
+            files = store.new_files([(file_day(filepath), filepath) for _, filepath in files])
+            chunks = split_into_chunks(files, workers * 4) if executor else [[f] for f in files]
+            tables = executor.map(collect_partial_stats, chunks) if executor else map(collect_partial_stats, chunks)
+            for chunk, table in tqdm(zip(chunks, tables), total=len(chunks),
+                                     desc='Update stats for {}'.format(year)):
+                store.fold(year, table, [filepath for _, filepath in chunk])
+            yield year, ColumnarSDStats(store.load_year(year))
+    finally:
+        if executor:
+            executor.shutdown()
+        store.close()
+
+
+def icollect_stats(folder, years=None, engine='rows', workers=1, store_path=None, on_day=None, read_ahead=2):
+    # year, model, serial_number, first_time_seen, last_time_seen, failure, failure_date
+    # on_day(year, df): called for every daily file of the sequential pass, after the previous year is yielded
+    # read_ahead: threads reading next daily files of the sequential pass (0 - no threads), files stay in order
+    if store_path:
+        yield from icollect_stats_incremental(folder, store_path, years, workers)
+        return
+    if workers > 1:  # only the columnar engine can merge partial stats
+        yield from icollect_stats_parallel(folder, years, workers)
+        return
+    stats_cls = {'rows': SDStats, 'columnar': ColumnarSDStats, 'compact': CompactSDStats}[engine]
+
+    def read(file):
+        with PROFILER.phase('read', file[2]):
+            return read_stats_columns(file[2])
+    files = [(file_idx, csv_filename, csv_filepath)
+             for file_idx, (csv_filename, csv_filepath) in enumerate(iget_next_csv(folder))
+             if not years or int(csv_filename[:4]) in years]
+    current_year, stats_by_year = None, stats_cls()
+    for (file_idx, csv_filename, csv_filepath), df in tqdm(iread_ahead(read, files, read_ahead), total=len(files)):
+        year = int(csv_filename[:4])
         current_year = current_year if current_year else year
-        df = pd.read_csv(csv_filepath)
         if year != current_year:  # csv's sorted by year
             yield current_year, stats_by_year
-            current_year, stats_by_year = year, SDStats()
-        for index, sample in df.iterrows():
-            stats_by_year.add(sample)
+            current_year, stats_by_year = year, stats_cls()
+        PROFILER.count(csv_filepath, rows_read=len(df), rows_kept=len(df))
+        with PROFILER.phase('aggregate', csv_filepath):
+            if engine == 'rows':
+                for index, sample in df.iterrows():
+                    stats_by_year.add(sample)
+            else:
+                stats_by_year.add_day(df, file_idx)
+        if on_day:
+            with PROFILER.phase('sample', csv_filepath):
+                on_day(year, df)
         del df
     if current_year:  # at least one record
         yield current_year, stats_by_year
@@ -129,47 +534,83 @@ def show_stats(stats, year):
                 .format(model_bucket.model, model_bucket.n_serial_numbers, model_bucket.n_failures))
 
 
-def save_stats(stats, filepath, year):
+def merge_stats(frames):
+    # stats of years (see SDStats.to_frame) -> one row per drive over all years, year is the last year of a drive
+    df = text_dates(pd.concat([frame for frame in frames if len(frame)], ignore_index=True))
+    failure = df['failure'].astype(bool)
+    df = df.assign(failure=failure, failure_date=df['failure_date'].where(failure))
+    df = df.groupby(['model', 'serial_number'], sort=False, as_index=False).agg(
+        year=('year', 'max'), first_time_seen=('first_time_seen', 'min'), last_time_seen=('last_time_seen', 'max'),
+        failure=('failure', 'any'), failure_date=('failure_date', 'max'))
+    return df[['year', 'model', 'serial_number', 'first_time_seen', 'last_time_seen', 'failure', 'failure_date']]
+
+
+def get_stats_filepath(filepath, suffix, fmt='csv'):
+    filepath = with_format(filepath, fmt)
     ext_idx = filepath.rfind('.')
     ext_idx = len(filepath) if ext_idx == -1 else ext_idx
-    out_fp = ''.join([filepath[:ext_idx], '_', str(year), filepath[ext_idx:]])
-    rows = []
-    for model, model_bucket in stats.model_buckets.items():
-        for serial_number, sn_obj in model_bucket.serial_numbers.items():
-            rows.append({
-                'year': year,
-                'model': model,
-                'serial_number': serial_number,
-                'first_time_seen': sn_obj.first_seen,
-                'last_time_seen': sn_obj.last_seen,
-                'failure': sn_obj.failure,
-                'failure_date': sn_obj.failure_date
-            })
-    df = pd.DataFrame(rows)
-    df.to_csv(out_fp, index=False)
+    return ''.join([filepath[:ext_idx], '_', str(suffix), filepath[ext_idx:]])
+
+
+def save_stats(stats, filepath, year, fmt='csv'):
+    out_fp = get_stats_filepath(filepath, year, fmt)
+    with PROFILER.phase('save'):
+        df = stats.to_frame(year)
+        write_table(df, out_fp)
     print('saved stats to {}'.format(out_fp))
     return out_fp
 
 
+def save_lifetime_stats(df, filepath, fmt='csv'):
+    # merge_stats of all years -> stats_lifetime.csv, collect_data.py takes it with a folder of all years
+    out_fp = get_stats_filepath(filepath, 'lifetime', fmt)
+    with PROFILER.phase('save'):
+        write_table(df, out_fp)
+    print('saved lifetime stats to {}'.format(out_fp))
+    return out_fp
+
+
+def save_sample(sampler, stats, filepath, year, fmt='csv'):
+    # sampled healthy drives and all failured drives of a year in the stats format: stats_sample_YYYY.csv
+    out_fp = get_stats_filepath(filepath, 'sample_{}'.format(year), fmt)
+    with PROFILER.phase('save'):
+        df = stats.to_frame(year)
+        failured = df[df['failure'].astype(bool)] if len(df) else df
+        write_table(pd.concat([sampler.to_frame(year), failured], ignore_index=True), out_fp)
+    print('saved sample to {}'.format(out_fp))
+    return out_fp
+
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Process arguments')
-    parser.add_argument('--dump', action='store_true')
-    parser.add_argument('--stats_filepath', type=str, default=os.path.join('data', 'stats.csv'))
-    parser.add_argument('--folder', type=str, default='data')
-    parser.add_argument('-y', '--year', type=int, action='append')
+    add_stats_arguments(parser)
     return parser.parse_args()
 
 
 def check_args(args):
-    if not os.path.exists(args.folder):
-        raise RuntimeError("Folder {} doesn't exist".format(arg.folder))
+    check_stats_arguments(args)
+
+
+def main(args):
+    with profile_run(args.profile, args.cprofile):
+        lifetime = None
+        samplers = defaultdict(lambda: HealthySampler(args.sample, args.sample_min_days))
+        on_day = (lambda year, df: samplers[year].add_day(df)) if args.sample else None
+        for year, stats in icollect_stats(args.folder, args.year, args.engine, args.workers, args.store, on_day,
+                                          args.read_ahead):
+            show_stats(stats, year)
+            if args.dump:
+                save_stats(stats, args.stats_filepath, year, args.format)
+            if args.sample:
+                save_sample(samplers.pop(year), stats, args.stats_filepath, year, args.format)
+            if args.lifetime:  # years are merged one by one, only stats of one year are kept besides the result
+                frame = stats.to_frame(year)
+                lifetime = frame if lifetime is None else merge_stats([lifetime, frame])
+        if lifetime is not None:
+            save_lifetime_stats(merge_stats([lifetime]), args.stats_filepath, args.format)
 
 
 if __name__ == '__main__':
     args = parse_arguments()
     check_args(args)
-    for year, stats in icollect_stats(args.folder, args.year):
-        show_stats(stats, year)
-        if args.dump:
-            save_stats(stats, args.stats_filepath, year)
-
+    main(args)
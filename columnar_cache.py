@@ -0,0 +1,272 @@
+import os
+import json
+import shutil
+import argparse
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from profiling import PROFILER, add_profile_arguments, profile_run
+from dataset_files import get_dirs_with_years, iget_next_file
+
+
+# Columnar cache of daily csv files: <year folder>/_cache/Q<quarter>/
+#   meta.json: columns and their types, days: {filename: [start_row, end_row, columns of the day]}
+#   <column>.npy: values of all days of the quarter (can be opened with mmap)
+#   <column>.dict.npy: dictionary of a string column, <column>.npy keeps int32 codes
+# Cached days are listed as virtual paths <year folder>/_cache/Q<quarter>/YYYY-MM-DD.csv
+CACHE_DIR = '_cache'
+META_FILE = 'meta.json'
+DICT_COLUMNS = ['serial_number', 'model']
+DATE_COLUMN = 'date'
+INT_COLUMNS = {'failure': 'int8'}
+FLOAT_TYPE = 'float64'
+NUMERIC_TYPES = ['int32', 'int64', 'float32', 'float64']  # compact types of a schema registry kept by the cache
+
+_metas = {}  # cache folder -> (mtime, meta)
+
+
+def get_quarter(csv_filename):
+    return (int(csv_filename[5:7]) - 1) // 3 + 1
+
+
+def get_cache_folder(year_folder, quarter):
+    return os.path.join(year_folder, CACHE_DIR, 'Q{}'.format(quarter))
+
+
+def load_meta(cache_folder):
+    meta_path = os.path.join(cache_folder, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    mtime = os.path.getmtime(meta_path)
+    if cache_folder not in _metas or _metas[cache_folder][0] != mtime:
+        with open(meta_path) as f:
+            _metas[cache_folder] = (mtime, json.load(f))
+    return _metas[cache_folder][1]
+
+
+def get_cached_days(year_folder):
+    # {csv_filename: virtual path}
+    cached_days = {}
+    cache_root = os.path.join(year_folder, CACHE_DIR)
+    if not os.path.isdir(cache_root):
+        return cached_days
+    for quarter_dir in sorted(os.listdir(cache_root)):
+        cache_folder = os.path.join(cache_root, quarter_dir)
+        meta = load_meta(cache_folder)
+        if meta is None:
+            continue
+        for csv_filename in meta['days']:
+            cached_days[csv_filename] = os.path.join(cache_folder, csv_filename)
+    return cached_days
+
+
+def with_cached_days(year_folder, files):
+    # files: [(csv_filename, csv_filepath)], cached days replace csv files and are added if csv is removed
+    cached_days = get_cached_days(year_folder)
+    if not cached_days:
+        return files
+    files = {csv_filename: csv_filepath for csv_filename, csv_filepath in files}
+    files.update(cached_days)
+    return list(files.items())
+
+
+def iget_next_csv(folder):
+    # daily files of all years sorted by date (a folder without year folders is one year), cached days included
+    years_directories = get_dirs_with_years(folder)  # sorted by year
+    year_paths = [year_path.path for year_path in years_directories] if years_directories else [folder]
+    for year_path in year_paths:
+        yield from sorted(with_cached_days(year_path, list(iget_next_file(year_path, '.csv'))))
+
+
+def _cached_day(csv_filepath):
+    cache_folder, csv_filename = os.path.split(csv_filepath)
+    meta = load_meta(cache_folder)
+    if meta is None or csv_filename not in meta['days']:
+        return None, None
+    return cache_folder, meta
+
+
+def _to_text(values, column):
+    if column == DATE_COLUMN:
+        return values.astype('datetime64[D]').astype(str)
+    if values.dtype.kind in 'iub':
+        return values.astype(str)
+    if values.dtype.kind == 'f':  # SMART values are integers, keep them as in csv files
+        text = np.where(np.isnan(values), 0, values).astype(np.int64).astype(str).astype(object)
+        non_integer = ~np.isnan(values) & (values != np.floor(values))
+        text[non_integer] = values[non_integer].astype(str)
+        text[np.isnan(values)] = ''
+        return text
+    return values
+
+
+def _read_cached(cache_folder, meta, csv_filename, columns, start, end, text, dtypes=None):
+    day_start, day_end, day_columns = meta['days'][csv_filename]
+    start, end = day_start + start, min(day_start + end, day_end)
+    data = {}
+    for column in day_columns:
+        if columns is not None and column not in columns:
+            continue
+        values = np.load(os.path.join(cache_folder, column + '.npy'), mmap_mode='r')[start:end]
+        if column in DICT_COLUMNS:
+            values = np.load(os.path.join(cache_folder, column + '.dict.npy'))[values].astype(object)
+        elif column == DATE_COLUMN and not text:
+            values = values.astype('datetime64[D]').astype(str).astype(object)
+        else:
+            values = np.array(values)
+        data[column] = _to_text(values, column) if text else values
+    df = pd.DataFrame(data)
+    if dtypes and not text:
+        df = df.astype({column: dtype for column, dtype in dtypes.items() if column in data})
+    return df
+
+
+def read_day_header(csv_filepath):
+    cache_folder, meta = _cached_day(csv_filepath)
+    if cache_folder:
+        return list(meta['days'][os.path.basename(csv_filepath)][2])
+    return list(pd.read_csv(csv_filepath, nrows=0).columns)
+
+
+def iread_day(csv_filepath, columns=None, text=False, chunksize=None, dtypes=None):
+    # Yields chunks of a day (a csv file or a cached day), columns are in order of the day.
+    # text: values as in csv files (str, empty string for missing values)
+    # dtypes: {column: dtype} of values (schema.get_day_dtypes), types are inferred by default
+    cache_folder, meta = _cached_day(csv_filepath)
+    if cache_folder is None:
+        if text:
+            kwargs = dict(dtype=str, keep_default_na=False)
+        else:
+            kwargs = dict(dtype=dtypes or {column: str for column in DICT_COLUMNS})
+        if chunksize is None:
+            yield pd.read_csv(csv_filepath, usecols=columns, **kwargs)
+        else:
+            yield from pd.read_csv(csv_filepath, usecols=columns, chunksize=chunksize, **kwargs)
+        return
+    csv_filename = os.path.basename(csv_filepath)
+    day_start, day_end, _ = meta['days'][csv_filename]
+    step = chunksize if chunksize else max(day_end - day_start, 1)
+    for start in range(0, max(day_end - day_start, 1), step):
+        yield _read_cached(cache_folder, meta, csv_filename, columns, start, start + step, text, dtypes)
+
+
+def read_day(csv_filepath, columns=None, text=False, dtypes=None):
+    return next(iread_day(csv_filepath, columns, text, dtypes=dtypes))
+
+
+def _column_type(column, dtypes=None):
+    if column in DICT_COLUMNS or column == DATE_COLUMN:
+        return 'int32'
+    if column in INT_COLUMNS:
+        return INT_COLUMNS[column]
+    dtype = (dtypes or {}).get(column)
+    return dtype if dtype in NUMERIC_TYPES else FLOAT_TYPE
+
+
+def _encode(df, column, dictionaries, dtype=FLOAT_TYPE):
+    values = df[column]
+    if column in DICT_COLUMNS:
+        codes, uniques = pd.factorize(values.astype(str))
+        dictionary = dictionaries[column]
+        lookup = np.array([dictionary.setdefault(value, len(dictionary)) for value in uniques], dtype=np.int32)
+        return lookup[codes]
+    if column == DATE_COLUMN:
+        return pd.to_datetime(values, format='%Y-%m-%d').values.astype('datetime64[D]').astype(np.int32)
+    if column in INT_COLUMNS:
+        return values.values.astype(INT_COLUMNS[column])
+    return pd.to_numeric(values, errors='coerce').values.astype(dtype)
+
+
+def build_quarter_cache(cache_folder, files, dtypes=None):
+    # files: sorted [(csv_filename, path)], path is a csv file or an already cached day
+    # dtypes: compact types of columns of a schema registry, SMART values are float64 by default
+    headers = {csv_filename: read_day_header(path) for csv_filename, path in files}
+    sizes = {}
+    for csv_filename, path in files:
+        cache_folder_of_day, meta = _cached_day(path)
+        if cache_folder_of_day:
+            day_start, day_end, _ = meta['days'][csv_filename]
+            sizes[csv_filename] = day_end - day_start
+        else:
+            with open(path) as f:
+                sizes[csv_filename] = sum(1 for _ in f) - 1
+    columns = []
+    for header in headers.values():
+        columns += [column for column in header if column not in columns]
+    n_rows = sum(sizes.values())
+
+    tmp_folder = cache_folder + '.tmp'
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    arrays = {}
+    for column in columns:
+        arrays[column] = np.lib.format.open_memmap(
+            os.path.join(tmp_folder, column + '.npy'), mode='w+', dtype=_column_type(column, dtypes), shape=(n_rows,))
+        if arrays[column].dtype.kind == 'f':
+            arrays[column][:] = np.nan
+    dictionaries = defaultdict(dict)
+    days, start = {}, 0
+    for csv_filename, path in files:
+        df = read_day(path)
+        end = start + len(df)
+        for column in df.columns:
+            arrays[column][start:end] = _encode(df, column, dictionaries, arrays[column].dtype)
+        days[csv_filename] = [start, end, list(df.columns)]
+        start = end
+    for array in arrays.values():
+        array.flush()
+    del arrays
+    for column, dictionary in dictionaries.items():
+        np.save(os.path.join(tmp_folder, column + '.dict.npy'), np.array(list(dictionary), dtype=str))
+    meta = {'columns': {column: _column_type(column, dtypes) for column in columns}, 'days': days}
+    with open(os.path.join(tmp_folder, META_FILE), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(cache_folder, ignore_errors=True)
+    os.rename(tmp_folder, cache_folder)
+
+
+def get_quarter_dtypes(year_folder, files):
+    # dtypes of a schema registry if it has all files of a quarter (int32 columns have no missing values)
+    from schema import load_schema
+    schema = load_schema(year_folder)
+    if schema is None or not all(schema.has_file(csv_filename) for csv_filename, _ in files):
+        return None
+    return schema.dtypes(sorted({int(csv_filename[:4]) for csv_filename, _ in files}))
+
+
+def build_year_cache(year_folder):
+    # only quarters with csv files which are not cached yet are (re)built
+    cached_days = get_cached_days(year_folder)
+    by_quarter = defaultdict(dict)
+    for csv_filename, path in cached_days.items():
+        by_quarter[get_quarter(csv_filename)][csv_filename] = path
+    new_quarters = set()
+    for csv_filename, csv_filepath in iget_next_file(year_folder, '.csv'):
+        if csv_filename in cached_days:
+            continue
+        by_quarter[get_quarter(csv_filename)][csv_filename] = csv_filepath
+        new_quarters.add(get_quarter(csv_filename))
+    for quarter in tqdm(sorted(new_quarters), desc='Build columnar cache for {}'.format(year_folder)):
+        with PROFILER.phase('build_quarter'):
+            files = sorted(by_quarter[quarter].items())
+            build_quarter_cache(get_cache_folder(year_folder, quarter), files, get_quarter_dtypes(year_folder, files))
+
+
+def build_cache(folder):
+    years_directories = get_dirs_with_years(folder)
+    for year_path in years_directories:
+        build_year_cache(year_path.path)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('--folder', type=str, default='data')
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    with profile_run(args.profile, args.cprofile):
+        build_cache(args.folder)
@@ -0,0 +1,56 @@
+import os
+from collections import namedtuple
+
+
+# Layout of a downloaded dataset: <folder>/<...YYYY>/.../YYYY-MM-DD.csv, only the standard library is imported here,
+# so the sdfp.py command line doesn't load pandas
+
+# csv: text files as in the BackBlaze dataset
+# parquet: typed and compressed columns, needs pyarrow
+FORMATS = ['csv', 'parquet']
+
+YearPath = namedtuple('YearPath', ['year', 'path'])
+
+
+def get_dirs_with_years(folder):
+    MIN_YEAR, MAX_YEAR = 2010, 3000
+    directories = os.listdir(folder)
+    filtered_dirs = []
+    for d in directories:
+        year = d[-4:]
+        if not year.isdigit():
+            continue
+        year = int(year)
+        if not (MIN_YEAR < year < MAX_YEAR):
+            continue
+        filtered_dirs.append(YearPath(year, os.path.join(folder, d)))
+    filtered_dirs.sort()
+    return filtered_dirs
+
+
+def iget_next_file(folder, ext=None):
+    if ext is not None:
+        if ext[0] != '.':
+            raise RuntimeError("extention should start with '.'")
+    for dirpath, dnames, fnames in os.walk(folder):
+        for filename in fnames:
+            if filename[0] in ['_', '.']:
+                continue
+            if ext is not None and filename[-len(ext):] != ext:
+                continue
+            yield filename, os.path.join(dirpath, filename)
+
+
+def set_out_path(model, year=None, fmt='csv', history=None):
+    # a name of collect_data.py output
+    year = str(year)+'_' if year else ''
+    history = '_{}d'.format(history) if history else ''
+    return 'model_{}{}{}.{}'.format(year, model, history, fmt)
+
+
+def get_stats_year(stats_path):
+    # try to find a year in stats filepath in format: stats_2016.csv
+    try:
+        return int(os.path.splitext(stats_path)[0][-4:])
+    except ValueError:
+        return None
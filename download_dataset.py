@@ -1,8 +1,12 @@
 import os
 import argparse
+import hashlib
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import zipfile
+from profiling import PROFILER, profile_run
+from sdfp import add_download_arguments, check_download_arguments
 
 
 class BackBlaze(object):
@@ -17,9 +21,16 @@ class BackBlaze(object):
             2018: [1, 2, 3, 4]
     }
 
-    def __init__(self, folder, years=[]):
+    CHUNK_SIZE = 8*1024*1024
+    RETRIES = 5
+    TIMEOUT = 60
+
+    def __init__(self, folder, years=[], columnar_cache=False, workers=4, link_template=None):
         self.folder = folder
         self.years = years
+        self.columnar_cache = columnar_cache
+        self.workers = workers
+        self.link_template = link_template if link_template else self.LINK_TEMPLATE
         self._check_years()
         self._prepare_folder()
 
@@ -38,23 +49,68 @@ class BackBlaze(object):
         time = str(year)
         if q is not None:
             time = 'Q{}_'.format(q) + time
-        return self.LINK_TEMPLATE.format(time=time)
+        return self.link_template.format(time=time)
 
     def _form_zipfilepath(self, year, q):
         time_line = str(year)
         time_line += '_{}'.format(q) if q else ''
         return os.path.join(self.folder, 'data_{}.zip'.format(time_line))
 
+    def _download_part(self, url, part_filepath):
+        # continues a partial download with a range request, returns expected (size, sha1) of the file
+        offset = os.path.getsize(part_filepath) if os.path.exists(part_filepath) else 0
+        headers = {'Range': 'bytes={}-'.format(offset)} if offset else {}
+        with requests.get(url, stream=True, headers=headers, timeout=self.TIMEOUT) as response:
+            sha1 = response.headers.get('x-bz-content-sha1')
+            if response.status_code == 416:  # nothing left to download
+                return int(response.headers.get('Content-Range', '*/0').split('/')[-1]), sha1
+            response.raise_for_status()
+            if response.status_code != 206:  # range isn't supported, download from the beginning
+                offset = 0
+            size = response.headers.get('Content-Length')
+            size = offset + int(size) if size is not None else None
+            with open(part_filepath, 'ab' if offset else 'wb') as f, \
+                    tqdm(total=size, initial=offset, unit='B', unit_scale=True, leave=False,
+                         desc=os.path.basename(part_filepath)) as progress:
+                for data in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                    f.write(data)
+                    progress.update(len(data))
+        return size, sha1
+
     def _download_file(self, url, filepath):
-        response = requests.get(url, stream=True)
-        with open(filepath, 'wb') as f:
-            for data in tqdm(response.iter_content(chunk_size=256*1024*1024)):
-                f.write(data)
+        part_filepath = filepath + '.part'
+        for attempt in range(self.RETRIES):
+            try:
+                size, sha1 = self._download_part(url, part_filepath)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt == self.RETRIES - 1:
+                    raise
+        self._verify_file(part_filepath, size, sha1)
+        os.replace(part_filepath, filepath)
+
+    def _verify_file(self, filepath, size, sha1):
+        file_size = os.path.getsize(filepath)
+        if size is not None and file_size != size:
+            os.remove(filepath)
+            raise RuntimeError("File {} has size {}, expected {}".format(filepath, file_size, size))
+        if sha1 is not None and sha1 != 'none':
+            hasher = hashlib.sha1()
+            with open(filepath, 'rb') as f:
+                for data in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                    hasher.update(data)
+            if hasher.hexdigest() != sha1:
+                os.remove(filepath)
+                raise RuntimeError("File {} has wrong sha1".format(filepath))
+        with zipfile.ZipFile(filepath, 'r') as zip_ref:
+            bad_file = zip_ref.testzip()
+        if bad_file is not None:
+            os.remove(filepath)
+            raise RuntimeError("File {} is broken in {}".format(bad_file, filepath))
 
     def _unzip_file(self, filepath, tgt_folder):
         tgt_folder = os.path.join(self.folder, tgt_folder)
-        if not os.path.exists(tgt_folder):
-            os.makedirs(tgt_folder)
+        os.makedirs(tgt_folder, exist_ok=True)
         with zipfile.ZipFile(filepath, 'r') as zip_ref:
             zip_ref.extractall(path=tgt_folder)
 
@@ -66,29 +122,48 @@ class BackBlaze(object):
             times += [(year, q) for q in qs]
         return times
 
-    def load(self):
-        times = self._get_times()
-        for year, q in tqdm(times, total=len(times), desc='Downloading files'):
-            url = self._form_url(year, q)
-            zipfilepath = self._form_zipfilepath(year, q)
+    def _load_time(self, year, q):
+        # extraction of a file runs while other files are downloaded
+        url = self._form_url(year, q)
+        zipfilepath = self._form_zipfilepath(year, q)
+        with PROFILER.phase('download'):
             self._download_file(url, zipfilepath)
+        with PROFILER.phase('unzip', zipfilepath):
             self._unzip_file(zipfilepath, str(year))
-            os.remove(zipfilepath)
+        os.remove(zipfilepath)
+
+    def load(self):
+        times = self._get_times()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self._load_time, year, q) for year, q in times]
+            for future in tqdm(as_completed(futures), total=len(times), desc='Downloading files'):
+                future.result()
+        if self.columnar_cache:
+            from columnar_cache import build_year_cache  # pandas is needed for the cache only
+            for year in self.years:
+                with PROFILER.phase('cache'):
+                    build_year_cache(os.path.join(self.folder, str(year)))
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Process arguments')
-    parser.add_argument('--backblaze', action='store_true')
-    parser.add_argument('--tgt_folder', type=str, default='data')
-    parser.add_argument('-y', '--year', type=int, action='append', required=True)
+    add_download_arguments(parser)
     return parser.parse_args()
 
 
+def check_args(args):
+    check_download_arguments(args)
+
+
+def main(args):
+    storage = BackBlaze(args.tgt_folder, years=args.year, columnar_cache=args.cache,
+                        workers=args.workers, link_template=args.url_template)
+    with profile_run(args.profile, args.cprofile):
+        storage.load()
+
+
 if __name__ == '__main__':
     args = parse_arguments()
-    if args.backblaze:
-        storage = BackBlaze(args.tgt_folder, years=args.year)
-    else:
-        raise RuntimeError("A storage is unknown")
-    storage.load()
+    check_args(args)
+    main(args)
 
@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from formats import FORMATS, TableWriter, iread_table
+from models.kdd import KDD_Hardcoded
+from profiling import PROFILER, add_profile_arguments, profile_run
+
+
+# Per drive change features of SMART attributes, computed by chunks of collect_data.py output.
+# Last rows of every drive are carried to the next chunk, so memory depends on a chunk size and a fleet size,
+# not on a file size. Windows and lags are in rows, i.e. days of a drive (days without a snapshot are skipped).
+DEFAULT_WINDOWS = [7, 30]
+
+
+def get_feature_columns(attributes, windows, lags):
+    columns = []
+    for attribute in attributes:
+        columns.append(attribute + '_delta')
+        columns += ['{}_lag_{}d'.format(attribute, lag) for lag in lags]
+        for window in windows:
+            columns += ['{}_mean_{}d'.format(attribute, window), '{}_max_{}d'.format(attribute, window)]
+        columns.append(attribute + '_days_since_change')
+    return columns
+
+
+def last_change_column(attribute):
+    return '_last_change_' + attribute
+
+
+class FeatureBuilder(object):
+    """
+    Streams chunks of rows (sorted by date or by serial_number, date) and returns their features in the same order.
+    All drives are carried to the next chunk, with sorted_by_serial=True (the order of the whole input)
+    only the current drive is carried.
+    """
+    def __init__(self, attributes, windows=DEFAULT_WINDOWS, lags=(), sorted_by_serial=False):
+        self.attributes = list(attributes)
+        self.windows = list(windows)
+        self.lags = list(lags)
+        self.columns = get_feature_columns(self.attributes, self.windows, self.lags)
+        self._tail = max([window - 1 for window in self.windows] + self.lags + [1])
+        self._carry = None
+        self.sorted_by_serial = sorted_by_serial
+        self._last_serial = None
+
+    def _values(self, chunk):
+        values = pd.DataFrame({'serial_number': chunk['serial_number'].to_numpy(dtype=str),
+                               'date': pd.to_datetime(chunk['date']).values.astype('datetime64[D]')})
+        for attribute in self.attributes:
+            column = chunk[attribute] if attribute in chunk.columns else pd.Series(np.nan, index=chunk.index)
+            values[attribute] = pd.to_numeric(column.replace('', None), errors='coerce').astype('float64').values
+            values[last_change_column(attribute)] = np.datetime64('NaT', 'D')
+        return values
+
+    def transform(self, chunk):
+        values = self._values(chunk)
+        self._check_order(values['serial_number'].values)
+        n_carry = 0 if self._carry is None else len(self._carry)
+        frame = values if self._carry is None else pd.concat([self._carry, values], ignore_index=True)
+        order = np.lexsort((frame['date'].values, frame['serial_number'].values))
+        frame = frame.iloc[order]  # index keeps positions: carried rows, then rows of the chunk
+        groups = frame.groupby('serial_number', sort=False)
+        carried = frame.index.values < n_carry
+        serial_numbers, positions = frame['serial_number'], groups.cumcount()
+        features = {}
+        for attribute in self.attributes:
+            column, grouped = frame[attribute], groups[attribute]
+            previous = grouped.shift(1)
+            features[attribute + '_delta'] = column - previous
+            for lag in self.lags:
+                features['{}_lag_{}d'.format(attribute, lag)] = grouped.shift(lag)
+            # rolling over the sorted column, first rows of a drive use cumulative values of the drive instead
+            notna = column.notna()
+            prefix_mean = column.fillna(0).groupby(serial_numbers, sort=False).cumsum() / \
+                notna.groupby(serial_numbers, sort=False).cumsum()
+            prefix_max = column.fillna(-np.inf).groupby(serial_numbers, sort=False).cummax().replace(-np.inf, np.nan)
+            for window in self.windows:
+                rolling = column.rolling(window, min_periods=1)
+                is_prefix = positions < window - 1
+                features['{}_mean_{}d'.format(attribute, window)] = rolling.mean().where(~is_prefix, prefix_mean)
+                features['{}_max_{}d'.format(attribute, window)] = rolling.max().where(~is_prefix, prefix_max)
+            # a first row of a drive is a change, carried rows keep a date of the last change before them
+            changed = ~((column == previous) | (column.isna() & previous.isna()))
+            change_date = frame['date'].where(changed)
+            change_date[carried] = frame[last_change_column(attribute)][carried]
+            last_change = change_date.groupby(serial_numbers, sort=False).ffill()
+            frame[last_change_column(attribute)] = last_change
+            features[attribute + '_days_since_change'] = (frame['date'] - last_change).dt.days
+        features = pd.DataFrame(features, index=frame.index)[self.columns]
+        self._update_carry(frame)
+        features = features[features.index >= n_carry].sort_index()
+        features.index = chunk.index
+        return features
+
+    def _check_order(self, serial_numbers):
+        # serial_numbers of a chunk in the input order, carried rows are wrong for an unsorted input
+        if not self.sorted_by_serial or not len(serial_numbers):
+            return
+        if not (np.all(serial_numbers[1:] >= serial_numbers[:-1]) and
+                (self._last_serial is None or serial_numbers[0] >= self._last_serial)):
+            raise RuntimeError('Rows are not sorted by serial_number')
+        self._last_serial = serial_numbers[-1]
+
+    def _update_carry(self, frame):
+        carry = frame.groupby('serial_number', sort=False).tail(self._tail)
+        if self.sorted_by_serial and self._last_serial is not None:  # previous drives are finished
+            carry = carry[carry['serial_number'].values == self._last_serial]
+        self._carry = carry.reset_index(drop=True)
+
+
+def get_features_filepath(filepath, fmt=None):
+    root, ext = os.path.splitext(filepath)
+    return root + '_features' + ('.' + fmt if fmt else ext)
+
+
+def build_features(filepath, out_filepath, attributes, windows=DEFAULT_WINDOWS, lags=(), chunksize=256*1024,
+                   sorted_by_serial=False):
+    # returns a number of rows and seconds
+    start = time.time()
+    builder = FeatureBuilder(attributes, windows, lags, sorted_by_serial)
+    writer, n_rows = None, 0
+    try:
+        for chunk in PROFILER.iter('read', iread_table(filepath, chunksize=chunksize, text=True), filepath):
+            if writer is None:
+                writer = TableWriter(out_filepath, list(chunk.columns) + builder.columns)
+            with PROFILER.phase('features', filepath):
+                features = builder.transform(chunk)
+            writer.write(pd.concat([chunk, features], axis=1))
+            n_rows += len(chunk)
+            PROFILER.count(filepath, rows_read=len(chunk), rows_kept=len(chunk))
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows, time.time() - start
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('-csv', '--csv', type=str, action='append', required=True, help='collect_data.py output')
+    parser.add_argument('-a', '--attribute', type=str, action='append', help='KDD attributes by default')
+    parser.add_argument('-w', '--window', type=int, action='append', help='rolling windows in days, 7 and 30 by default')
+    parser.add_argument('-l', '--lag', type=int, action='append', default=[], help='lags in days')
+    parser.add_argument('--chunksize', type=int, default=256*1024)
+    parser.add_argument('--format', type=str, choices=FORMATS, default=None, help='the same as an input by default')
+    parser.add_argument('--sorted_by_serial', action='store_true',
+                        help='rows are sorted by serial_number, date: only the current drive is kept in memory')
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    attributes = args.attribute if args.attribute else KDD_Hardcoded.ATTRIBUTES
+    windows = args.window if args.window else DEFAULT_WINDOWS
+    with profile_run(args.profile, args.cprofile):
+        for filepath in args.csv:
+            out_filepath = get_features_filepath(filepath, args.format)
+            n_rows, seconds = build_features(filepath, out_filepath, attributes, windows, args.lag, args.chunksize,
+                                             args.sorted_by_serial)
+            print('{}: rows: {}, seconds: {:.1f}, rows/sec: {:.0f}'.format(
+                out_filepath, n_rows, seconds, n_rows / max(seconds, 1e-9)), file=sys.stderr)
@@ -0,0 +1,212 @@
+import os
+import csv
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from profiling import PROFILER
+from dataset_files import FORMATS  # csv, parquet: defined without pandas for the command line
+
+
+PARQUET_COMPRESSION = 'zstd'
+DATE_COLUMNS = ['date', 'first_time_seen', 'last_time_seen', 'failure_date']
+STRING_COLUMNS = ['serial_number', 'model']
+INT_COLUMNS = {'failure': 'int8', 'year': 'int16'}
+NULLABLE_TYPES = {'int32': 'Int32', 'int64': 'Int64'}  # int columns of a schema registry can get nulls by reindex
+
+
+def require_parquet():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise RuntimeError("parquet format needs pyarrow: pip install pyarrow")
+
+
+def get_format(filepath):
+    return 'parquet' if filepath.endswith('.parquet') else 'csv'
+
+
+def with_format(filepath, fmt):
+    root, ext = os.path.splitext(filepath)
+    return root + '.' + fmt if ext else filepath
+
+
+def typed_frame(df, dtypes=None):
+    # text values -> compact types, all columns get the same type in every chunk
+    # dtypes: {column: dtype} of SMART values (schema.SchemaRegistry.dtypes), float64 by default
+    dtypes = dtypes or {}
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column in DATE_COLUMNS:
+            columns[column] = pd.to_datetime(values.replace('', None), format='%Y-%m-%d')
+        elif column in STRING_COLUMNS:
+            columns[column] = values.astype(str)
+        elif column in INT_COLUMNS:
+            columns[column] = pd.to_numeric(values).astype(INT_COLUMNS[column])
+        elif dtypes.get(column) == 'category':  # parquet keeps strings dictionary encoded
+            columns[column] = values.astype(str)
+        elif column in dtypes:
+            dtype = NULLABLE_TYPES.get(dtypes[column], dtypes[column])
+            columns[column] = pd.to_numeric(values, errors='coerce').astype(dtype)
+        else:
+            columns[column] = pd.to_numeric(values, errors='coerce').astype('float64')
+    return pd.DataFrame(columns, index=df.index)
+
+
+def text_dates(df):
+    # parquet keeps dates typed, the rest of the pipeline compares dates as 'YYYY-MM-DD' strings
+    for column in DATE_COLUMNS:
+        if column in df.columns and pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime('%Y-%m-%d')
+    return df
+
+
+def read_table(filepath, columns=None):
+    # columns: projection, only these columns are read from a file
+    if get_format(filepath) == 'parquet':
+        require_parquet()
+        return pd.read_parquet(filepath, columns=columns)
+    return pd.read_csv(filepath, usecols=columns)
+
+
+def iread_table(filepath, columns=None, chunksize=256*1024, text=False):
+    # chunks of a file, text: csv values are kept as strings (empty string for missing values)
+    if get_format(filepath) == 'parquet':
+        require_parquet()
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(filepath).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+        return
+    kwargs = dict(dtype=str, keep_default_na=False) if text else {}
+    yield from pd.read_csv(filepath, usecols=columns, chunksize=chunksize, **kwargs)
+
+
+def write_table(df, filepath):
+    if get_format(filepath) == 'parquet':
+        require_parquet()
+        typed_frame(df).to_parquet(filepath, index=False, compression=PARQUET_COMPRESSION)
+    else:
+        df.to_csv(filepath, index=False)
+
+
+class TableWriter(object):
+    """
+    Appends chunks of text rows with a fixed header to a csv or a parquet file.
+    Parquet rows are buffered and written by row groups of at least row_group_size rows,
+    dtypes of a schema registry give compact types of parquet columns.
+    """
+    def __init__(self, filepath, header, row_group_size=64*1024, lineterminator='\r\n', dtypes=None):
+        self.filepath = filepath
+        self.header = header
+        self.dtypes = dtypes
+        self.lineterminator = lineterminator
+        self.fmt = get_format(filepath)
+        self.row_group_size = row_group_size
+        self._buffer, self._buffered = [], 0
+        self._writer = self._schema = None
+        if self.fmt == 'parquet':
+            require_parquet()
+            self._file = None
+        else:
+            self._file = open(filepath, 'w')
+            csv.writer(self._file, lineterminator=lineterminator).writerow(header)
+
+    def write(self, df):
+        with PROFILER.phase('write'):
+            df = df.reindex(columns=self.header, fill_value='')
+            if self.fmt == 'csv':
+                df.to_csv(self._file, header=False, index=False, lineterminator=self.lineterminator)
+                return
+            self._buffer.append(df)
+            self._buffered += len(df)
+            if self._buffered >= self.row_group_size:
+                self._flush()
+
+    def _flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if not self._buffer:
+            return
+        df = typed_frame(pd.concat(self._buffer, ignore_index=True), self.dtypes)
+        self._buffer, self._buffered = [], 0
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._writer = pq.ParquetWriter(self.filepath, self._schema, compression=PARQUET_COMPRESSION)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self.fmt == 'csv':
+            self._file.close()
+            return
+        if self._writer is None and not self._buffer:  # keep an empty file with the header
+            self._buffer.append(pd.DataFrame(columns=self.header))
+        self._flush()
+        self._writer.close()
+
+
+def iread_ahead(read, items, workers=2, ahead=None):
+    # yields (item, read(item)) in order of items, next items are read by a thread pool meanwhile.
+    # At most `ahead` (2 * workers by default) results wait in memory, workers=0 reads items one by one
+    if workers <= 0:
+        for item in items:
+            yield item, read(item)
+        return
+    ahead = ahead if ahead else 2 * workers
+    pool = ThreadPoolExecutor(workers)
+    futures = deque()
+    try:
+        for item in items:
+            futures.append((item, pool.submit(read, item)))
+            if len(futures) >= ahead:
+                item, future = futures.popleft()
+                yield item, future.result()
+        while futures:
+            item, future = futures.popleft()
+            yield item, future.result()
+    finally:  # a consumer stopped early or failed: pending reads are dropped
+        for _, future in futures:
+            future.cancel()
+        pool.shutdown(wait=True)
+
+
+class BackgroundWriter(object):
+    """
+    Writes chunks of a writer (e.g. TableWriter) in a background thread.
+    write blocks while max_queue chunks wait (backpressure), an error of the thread is raised by write or close.
+    """
+    _CLOSE = object()
+
+    def __init__(self, writer, max_queue=16):
+        self.writer = writer
+        self._queue = queue.Queue(max_queue)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            df = self._queue.get()
+            if df is self._CLOSE:
+                return
+            if self._error is None:  # after an error chunks are dropped until close
+                try:
+                    self.writer.write(df)
+                except BaseException as e:
+                    self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, df):
+        self._raise_error()
+        self._queue.put(df)
+
+    def close(self):
+        self._queue.put(self._CLOSE)
+        self._thread.join()
+        self.writer.close()
+        self._raise_error()
@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+from formats import read_table
+from utils import FAR, FDR
+from models.kdd import KDD_Hardcoded
+
+
+# Evaluation of models on collect_data.py outputs (as in models_comparison.ipynb): drives with at least `history`
+# days, the last day of every drive is a sample. Evaluation sets and predictions of every model are cached on disk:
+#   <cache_dir>/set_<key>.pkl: an evaluation set, key: content hash of the dataset and history
+#   <cache_dir>/pred_<key>.npy: predictions, key: the set key, model class and parameters
+#   <cache_dir>/hashes.json: content hashes of datasets by path, size and modification time
+# The least recently used entries are removed when the cache is bigger than max_bytes.
+EvaluationSet = namedtuple('EvaluationSet', ['X', 'y'])
+
+CACHE_DIR = '.eval_cache'
+HASHES_FILE = 'hashes.json'
+MAX_CACHE_BYTES = 2**30
+BLOCK_SIZE = 2**20
+
+
+def build_evaluation_set(df, history=21):
+    # the last row of every drive with at least history rows, drives in order of their last date
+    dates = df['date'].to_numpy(dtype=str)
+    serial_numbers = df['serial_number'].to_numpy(dtype=str)
+    order = np.lexsort((dates, serial_numbers))
+    _, starts, sizes = np.unique(serial_numbers[order], return_index=True, return_counts=True)
+    rows = order[(starts + sizes - 1)[sizes >= history]]
+    rows = rows[np.lexsort((rows, dates[rows]))]
+    samples = df.iloc[rows].reset_index(drop=True)
+    return EvaluationSet(samples.drop(columns=['failure']), samples['failure'].to_numpy())
+
+
+def get_model_params(model):
+    # parameters of sklearn-like models, public attributes otherwise (weights of trained models should be passed
+    # as params of evaluate, e.g. a checkpoint path)
+    if hasattr(model, 'get_params'):
+        return model.get_params()
+    return {key: value for key, value in vars(model).items() if not key.startswith('_')}
+
+
+def save_json(obj, filepath):
+    with open(filepath, 'w') as f:
+        json.dump(obj, f)
+
+
+def get_key(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+class EvaluationCache(object):
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def content_hash(self, filepath):
+        # a file is hashed again only if its size or modification time are changed
+        hashes_path = os.path.join(self.cache_dir, HASHES_FILE)
+        hashes = {}
+        if os.path.exists(hashes_path):
+            with open(hashes_path) as f:
+                hashes = json.load(f)
+        stat = os.stat(filepath)
+        path = os.path.abspath(filepath)
+        if path in hashes and hashes[path][:2] == [stat.st_size, stat.st_mtime_ns]:
+            return hashes[path][2]
+        hasher = hashlib.sha1()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                hasher.update(block)
+        hashes[path] = [stat.st_size, stat.st_mtime_ns, hasher.hexdigest()]
+        self._write(hashes_path, lambda tmp_path: save_json(hashes, tmp_path))
+        return hashes[path][2]
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, name, load):
+        path = self._path(name)
+        if not os.path.exists(path):
+            return None
+        os.utime(path)  # the modification time is the last use
+        return load(path)
+
+    def put(self, name, save):
+        self._write(self._path(name), save)
+        self.evict(keep=name)
+
+    def _write(self, path, save):
+        root, ext = os.path.splitext(path)
+        tmp_path = root + '.tmp' + ext
+        save(tmp_path)
+        os.replace(tmp_path, path)
+
+    def entries(self):
+        # [(last use, bytes, name)] from the least recently used
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name == HASHES_FILE or '.tmp' in name:
+                continue
+            stat = os.stat(self._path(name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            os.remove(self._path(name))
+            total -= size
+
+    def evaluation_set(self, filepath, history=21):
+        key = get_key(self.content_hash(filepath), history)
+        cached = self.get('set_{}.pkl'.format(key), pd.read_pickle)
+        if cached is not None:
+            return key, EvaluationSet(*cached)
+        evaluation_set = build_evaluation_set(read_table(filepath), history)
+        self.put('set_{}.pkl'.format(key), lambda path: pd.to_pickle(tuple(evaluation_set), path))
+        return key, evaluation_set
+
+    def predictions(self, set_key, evaluation_set, model, params=None):
+        model_class = '{}.{}'.format(type(model).__module__, type(model).__qualname__)
+        params = get_model_params(model) if params is None else params
+        name = 'pred_{}.npy'.format(get_key(set_key, model_class, params))
+        cached = self.get(name, np.load)
+        if cached is not None:
+            return cached
+        predictions = np.asarray(model.predict(evaluation_set.X), dtype=float)
+        self.put(name, lambda path: np.save(path, predictions))
+        return predictions
+
+
+def evaluate(model, filepath, history=21, params=None, cache=None):
+    # FAR and FDR of a model on a dataset file, only predictions of a new model (or new params) are computed
+    cache = cache or EvaluationCache()
+    start = time.time()
+    set_key, evaluation_set = cache.evaluation_set(filepath, history)
+    predictions = cache.predictions(set_key, evaluation_set, model, params)
+    y = np.asarray(evaluation_set.y)
+    return {'FAR': FAR(y, predictions), 'FDR': FDR(y, predictions), 'samples': len(y),
+            'failured': int((y == 1).sum()), 'seconds': time.time() - start}
+
+
+def results_table(results):
+    # results: {model name: evaluate(...)} -> rows of the Results table in README.md
+    width = max([len('model')] + [len(name) for name in results])
+    lines = ['| {} | FAR   | FDR   |'.format('model'.ljust(width)), '|{}|-------|-------|'.format('-' * (width + 2))]
+    for name, metrics in results.items():
+        lines.append('| {} | {:.3f} | {:.3f} |'.format(name.ljust(width), metrics['FAR'], metrics['FDR']))
+    return '\n'.join(lines)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('-csv', '--csv', type=str, required=True, help='collect_data.py output, csv or parquet')
+    parser.add_argument('--history', type=int, default=21, help='min days of a drive in the evaluation set')
+    parser.add_argument('--cache_dir', type=str, default=CACHE_DIR)
+    parser.add_argument('--max_cache_mb', type=int, default=MAX_CACHE_BYTES // 2**20)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    cache = EvaluationCache(args.cache_dir, args.max_cache_mb * 2**20)
+    results = {'KDD hardcoded': evaluate(KDD_Hardcoded(), args.csv, args.history, cache=cache)}
+    for name, metrics in results.items():
+        print('{}: {} samples ({} failured), {:.2f}s'.format(name, metrics['samples'], metrics['failured'],
+                                                              metrics['seconds']))
+    print(results_table(results))
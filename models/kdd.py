@@ -6,6 +6,32 @@ import numpy as np
 # Probability for change
 Prediction = namedtuple('Prediction', ['probability', 'confidence'])
 
+# vendor by a prefix of a model name, if there is no 'vendor' attribute
+VENDOR_PREFIXES = [('ST', 'Seagate'), ('Seagate', 'Seagate'), ('Hitachi', 'Hitachi'), ('HGST', 'Hitachi')]
+
+
+def get_vendor(metrics):
+    if 'vendor' in metrics:
+        return metrics['vendor']
+    if 'model' not in metrics:
+        return 'Seagate'
+    for prefix, vendor in VENDOR_PREFIXES:
+        if str(metrics['model']).startswith(prefix):
+            return vendor
+    return None
+
+
+def get_vendors(df):
+    if 'vendor' in df.columns:
+        return df['vendor'].values
+    if 'model' not in df.columns:
+        return np.full(len(df), 'Seagate', dtype=object)
+    models = df['model'].astype(str)
+    vendors = np.full(len(df), None, dtype=object)
+    for prefix, vendor in VENDOR_PREFIXES:
+        vendors[(vendors == None) & models.str.startswith(prefix).values] = vendor  # noqa: E711
+    return vendors
+
 
 class KDD_Hardcoded(object):
     """
@@ -23,6 +49,8 @@ class KDD_Hardcoded(object):
         smart_5_raw
         smart_197_raw
     """
+    ATTRIBUTES = ['smart_1_normalized', 'smart_187_normalized', 'smart_188_raw', 'smart_197_raw', 'smart_240_raw',
+                  'smart_1_raw', 'smart_3_raw', 'smart_5_raw']
     UNC_PREDICTION = Prediction(0, 0)
     HEALTHY_PREDICTION = Prediction(0, 1)
 
@@ -58,8 +86,36 @@ class KDD_Hardcoded(object):
             return Prediction(0, 0.97)
         return self.HEALTHY_PREDICTION
 
+    def _seagate_predict_np(self, df):
+        smart_197, smart_188 = df['smart_197_raw'].values, df['smart_188_raw'].values
+        smart_1, smart_187 = df['smart_1_normalized'].values, df['smart_187_normalized'].values
+        smart_240 = df['smart_240_raw'].values
+        # the same rules as in _seagate_predict, the first matched rule wins
+        return self._select([
+            (smart_197 < 2) & (smart_188 > 0) & (0 <= smart_1) & (smart_1 < 117),
+            smart_197 >= 2,
+            (smart_197 < 2) & (smart_188 > 0) & (smart_1 > 117),
+            (smart_197 < 2) & (smart_188 == 0) & (smart_187 < 100) & (smart_240 < 14780 * 10**6),
+        ], [Prediction(0, 1), Prediction(1, 1), Prediction(1, 0.8), Prediction(1, 0.97)])
+
+    def _hitachi_predict_np(self, df):
+        smart_1, smart_3 = df['smart_1_raw'].values, df['smart_3_raw'].values
+        smart_5, smart_197 = df['smart_5_raw'].values, df['smart_197_raw'].values
+        # the same rules as in _hitachi_predict, the first matched rule wins
+        return self._select([
+            (smart_197 > 1) & (smart_3 > 626),
+            (smart_197 > 5) & (smart_3 < 626) & (smart_5 > 17),
+            (smart_197 > 1) & (smart_3 < 626) & (smart_5 < 17),
+            (smart_197 < 1) & (smart_5 < 7200) & (smart_3 > 629) & (0 <= smart_1) & (smart_1 <= 109),
+        ], [Prediction(1, 1), Prediction(1, 0.92), Prediction(1, 1), Prediction(0, 0.97)])
+
+    def _select(self, conditions, predictions):
+        probability = np.select(conditions, [p.probability for p in predictions], self.HEALTHY_PREDICTION.probability)
+        confidence = np.select(conditions, [p.confidence for p in predictions], self.HEALTHY_PREDICTION.confidence)
+        return Prediction(probability.astype(float), confidence.astype(float))
+
     def _predict(self, metrics):
-        vendor = metrics.get('vendor', 'Seagate')
+        vendor = get_vendor(metrics)
         if vendor and (vendor not in self._supported_models):
             return self.UNC_PREDICTION
         if vendor == 'Seagate':
@@ -69,13 +125,21 @@ class KDD_Hardcoded(object):
         return self.UNC_PREDICTION
 
     def _predict_pd(self, df):
-        predictions = []
-        for _, metrics in df.iterrows():
-            prob = self._predict(metrics).probability
-            predictions.append(prob)
-        return np.array(predictions)
+        # rows of every vendor are scored with vectorized rules, other vendors get UNC_PREDICTION
+        probability = np.full(len(df), self.UNC_PREDICTION.probability, dtype=float)
+        confidence = np.full(len(df), self.UNC_PREDICTION.confidence, dtype=float)
+        vendors = get_vendors(df)
+        for vendor, predict in [('Seagate', self._seagate_predict_np), ('Hitachi', self._hitachi_predict_np)]:
+            mask = vendors == vendor
+            if mask.any():
+                probability[mask], confidence[mask] = predict(df[mask])
+        return Prediction(probability, confidence)
 
     def predict(self, df):
+        if isinstance(df, pd.DataFrame):
+            return self._predict_pd(df).probability
+
+    def predict_with_confidence(self, df):
         if isinstance(df, pd.DataFrame):
             return self._predict_pd(df)
 
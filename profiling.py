@@ -0,0 +1,164 @@
+import os
+import sys
+import csv
+import json
+import time
+import threading
+import contextlib
+from collections import defaultdict
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+
+# Instrumentation shared by the scripts (--profile): wall time of phases, per file timings and counters, peak RSS.
+# PROFILER is disabled by default, then phase() returns a shared empty context and count() returns at once.
+# Phases running in threads (read-ahead, background writers) are summed over threads.
+NULL_CONTEXT = contextlib.nullcontext()
+REPORT_FORMATS = ['.json', '.csv']
+
+
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)  # bytes on macOS, KB on Linux
+
+
+class Profiler(object):
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.start = time.time()
+        self.phases = defaultdict(lambda: {'seconds': 0.0, 'calls': 0})
+        self.files = {}
+
+    def enable(self):
+        self.enabled = True
+        self._reset()
+
+    def _file(self, path):
+        # called under the lock
+        if path not in self.files:
+            size = os.path.getsize(path) if os.path.isfile(path) else 0
+            self.files[path] = {'path': path, 'bytes': size, 'rows_read': 0, 'rows_kept': 0}
+        return self.files[path]
+
+    def phase(self, name, path=None):
+        # with PROFILER.phase('read', path): ... seconds go to the phase and to the file record of path
+        if not self.enabled:
+            return NULL_CONTEXT
+        return self._phase(name, path)
+
+    @contextlib.contextmanager
+    def _phase(self, name, path):
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            with self._lock:
+                self.phases[name]['seconds'] += seconds
+                self.phases[name]['calls'] += 1
+                if path is not None:
+                    record = self._file(path)
+                    record[name + '_seconds'] = record.get(name + '_seconds', 0.0) + seconds
+
+    def iter(self, name, iterable, path=None):
+        # items of iterable (e.g. chunks of a file), time of getting every item goes to the phase
+        if not self.enabled:
+            return iterable
+        return self._iter(name, iterable, path)
+
+    def _iter(self, name, iterable, path):
+        iterator = iter(iterable)
+        while True:
+            with self._phase(name, path):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def count(self, path, rows_read=0, rows_kept=0):
+        if not self.enabled:
+            return
+        with self._lock:
+            record = self._file(path)
+            record['rows_read'] += rows_read
+            record['rows_kept'] += rows_kept
+
+    def report(self):
+        seconds = max(time.time() - self.start, 1e-9)
+        files = list(self.files.values())
+        rows_read = sum(record['rows_read'] for record in files)
+        return {
+            'script': os.path.basename(sys.argv[0]),
+            'argv': sys.argv[1:],
+            'seconds': round(seconds, 3),
+            'peak_rss_mb': get_peak_rss_mb(),
+            'files': len(files),
+            'bytes_read': sum(record['bytes'] for record in files),
+            'rows_read': rows_read,
+            'rows_kept': sum(record['rows_kept'] for record in files),
+            'files_per_sec': round(len(files) / seconds, 2),
+            'rows_per_sec': round(rows_read / seconds),
+            'phases': {name: {'seconds': round(phase['seconds'], 3), 'calls': phase['calls']}
+                       for name, phase in self.phases.items()},
+            'per_file': files,
+        }
+
+    def save(self, filepath):
+        # json: the whole report, csv: one row per file, phase and the total
+        report = self.report()
+        if os.path.splitext(filepath)[1] == '.json':
+            with open(filepath, 'w') as f:
+                json.dump(report, f, indent=2)
+            return
+        seconds_columns = sorted({key for record in report['per_file'] for key in record if key.endswith('_seconds')})
+        header = ['kind', 'name', 'seconds', 'calls', 'bytes', 'rows_read', 'rows_kept'] + seconds_columns
+        with open(filepath, 'w', newline='') as f:
+            writer = csv.DictWriter(f, header, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerow({'kind': 'total', 'name': report['script'], 'seconds': report['seconds'],
+                             'bytes': report['bytes_read'], 'rows_read': report['rows_read'],
+                             'rows_kept': report['rows_kept']})
+            for name, phase in report['phases'].items():
+                writer.writerow({'kind': 'phase', 'name': name, **phase})
+            for record in report['per_file']:
+                writer.writerow({'kind': 'file', 'name': record['path'], **record})
+
+
+PROFILER = Profiler()
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', type=str, default=None,
+                        help='report of phases and files: .json or .csv')
+    parser.add_argument('--cprofile', type=str, default=None, help='cProfile stats of the run (see pstats)')
+
+
+@contextlib.contextmanager
+def profile_run(report_path=None, cprofile_path=None):
+    # wraps the main part of a script, nothing is collected without paths
+    if report_path and os.path.splitext(report_path)[1] not in REPORT_FORMATS:
+        raise RuntimeError('Profile report should be .json or .csv, got: {}'.format(report_path))
+    if report_path:
+        PROFILER.enable()
+    profile = None
+    if cprofile_path:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        yield PROFILER
+    finally:
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(cprofile_path)
+        if report_path:
+            PROFILER.save(report_path)
+            print('saved profile to {}'.format(report_path), file=sys.stderr)
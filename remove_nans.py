@@ -1,62 +1,87 @@
 import os
 import argparse
-from shutil import copyfile
-import numpy as np
 import pandas as pd
 from tqdm import tqdm
+from formats import TableWriter, iread_table, with_format
+from profiling import PROFILER, profile_run
+from sdfp import add_clean_arguments, check_clean_arguments
 
 
-def copy_files(filepaths):
-    for filepath in filepaths:
-        copyfile(filepath, filepath + '.backup')
+# Two passes through a file by chunks: null fractions of columns, then a rewrite without smart_* columns
+# with too many nulls into a temporary file, which replaces the original one
 
 
-def get_non_nans_columns(df):
+def get_null_fractions(filepath, chunksize):
+    nulls, n_rows = None, 0
+    for chunk in iread_table(filepath, chunksize=chunksize, text=True):
+        chunk_nulls = (chunk.isna() | chunk.eq('')).sum()
+        nulls = chunk_nulls if nulls is None else nulls + chunk_nulls
+        n_rows += len(chunk)
+    if nulls is None:  # an empty file
+        return pd.Series(dtype=float)
+    return nulls / max(n_rows, 1)
+
+
+def get_non_nans_columns(null_fractions, max_null_fraction):
     result = []
-    item0 = df.iloc[0]
-    columns = df.columns
-    for column in columns:
+    for column, null_fraction in null_fractions.items():
         if not column.startswith('smart_'):
             result.append(column)
-        elif not np.isnan(item0[column]):
+        elif null_fraction <= max_null_fraction:
             result.append(column)
     return result
 
 
-def remove_nans_from_file(filepath):
-    df = pd.read_csv(filepath)
-    columns = get_non_nans_columns(df)
-    df = df[columns]
-    df.to_csv(filepath, index=False)
-
-
-def remove_nans_from_files(filepaths):
+def get_tmp_filepath(filepath):
+    root, ext = os.path.splitext(filepath)
+    return root + '.tmp' + ext
+
+
+def remove_nans_from_file(filepath, fmt=None, max_null_fraction=0.5, chunksize=256*1024, backup=False):
+    # fmt: format of the result, the same as the input by default
+    # backup: the original file is renamed to .backup instead of removing
+    with PROFILER.phase('null_fractions', filepath):
+        null_fractions = get_null_fractions(filepath, chunksize)
+    columns = get_non_nans_columns(null_fractions, max_null_fraction)
+    out_filepath = with_format(filepath, fmt) if fmt else filepath
+    tmp_filepath = get_tmp_filepath(out_filepath)
+    writer = TableWriter(tmp_filepath, columns, lineterminator='\n')
+    try:
+        with PROFILER.phase('rewrite', filepath):
+            for chunk in iread_table(filepath, columns=columns, chunksize=chunksize, text=True):
+                writer.write(chunk)
+                PROFILER.count(filepath, rows_read=len(chunk), rows_kept=len(chunk))
+    finally:
+        writer.close()
+    if backup:
+        os.replace(filepath, filepath + '.backup')
+    elif out_filepath != filepath:
+        os.remove(filepath)
+    os.replace(tmp_filepath, out_filepath)
+    return out_filepath
+
+
+def remove_nans(filepaths, replace, fmt=None, max_null_fraction=0.5, chunksize=256*1024):
     for filepath in tqdm(filepaths):
-        remove_nans_from_file(filepath)
-
-
-def remove_nans(filepaths, replace):
-    if not replace: # make backup
-        copy_files(filepaths)
-        print('Files were copied')
-    remove_nans_from_files(filepaths)
+        remove_nans_from_file(filepath, fmt, max_null_fraction, chunksize, backup=not replace)
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Process arguments')
-    parser.add_argument('-csv', '--csv', type=str, action='append')
-    parser.add_argument('-replace', '--replace', action='store_true')
+    add_clean_arguments(parser)
     return parser.parse_args()
 
 
 def check_args(args):
-    for filepath in args.csv:
-        if not os.path.exists(filepath):
-            raise RuntimeError("Filepath {} doesn't exist".format(filepath))
+    check_clean_arguments(args)
+
+
+def main(args):
+    with profile_run(args.profile, args.cprofile):
+        remove_nans(args.csv, args.replace, args.format, args.max_null_fraction, args.chunksize)
 
 
 if __name__ == '__main__':
     args = parse_arguments()
     check_args(args)
-    remove_nans(args.csv, args.replace)
-
+    main(args)
@@ -0,0 +1,218 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from formats import iread_ahead
+from columnar_cache import iget_next_csv, read_day
+from profiling import PROFILER, profile_run
+from sdfp import add_schema_arguments, check_schema_arguments
+
+
+# Schema registry of a dataset: <folder>/_schema.json, updated by a pass through new daily files only.
+#   years: {year: {files: [csv_filename], models: {model: {rows: N, columns: {column: counters}}}}}
+#   counters of a numeric column: [non null values, all values are integers, min, max], of a text column: [non null]
+# Columns with non null values of a model are populated, compact dtypes of columns are derived from counters.
+# Readers use the registry only for files it has seen, other files are read as before.
+# A serial number appears once in a daily file, so it is parsed as a string: serial numbers are dictionary encoded
+# where they repeat, in the columnar cache and in parquet files.
+SCHEMA_FILE = '_schema.json'
+ID_DTYPES = {'date': 'str', 'serial_number': 'str', 'model': 'category', 'failure': 'int8'}
+INT32_RANGE = (np.iinfo(np.int32).min, np.iinfo(np.int32).max)
+FLOAT32_MAX_INT = 2**24  # integers up to it are exact in float32
+
+_schemas = {}  # schema path -> (mtime, SchemaRegistry)
+
+
+def get_dtype(column, rows, counters):
+    if column in ID_DTYPES:
+        return ID_DTYPES[column]
+    if len(counters) == 1:
+        return 'category'
+    non_null, integer, low, high = counters
+    if not integer:
+        return 'float64'
+    if non_null == rows:  # no missing values
+        return 'int32' if low is None or INT32_RANGE[0] <= low and high <= INT32_RANGE[1] else 'int64'
+    return 'float32' if low is None or max(-low, high) <= FLOAT32_MAX_INT else 'float64'
+
+
+def merge_counters(counters, other):
+    if counters is None:
+        return list(other)
+    if len(counters) != len(other):  # a column is numeric in one file and text in another
+        return [counters[0] + other[0]]
+    if len(counters) == 1:
+        return [counters[0] + other[0]]
+    non_null, integer, low, high = counters
+    bounds = [value for value in (low, high, other[2], other[3]) if value is not None]
+    return [non_null + other[0], integer and other[1],
+            min(bounds) if bounds else None, max(bounds) if bounds else None]
+
+
+def count_day(df):
+    # {model: (rows, {column: counters})} of a daily file
+    models = df['model'].astype(str)
+    rows = models.value_counts(sort=False)
+    numeric = [column for column in df.columns
+               if column not in ID_DTYPES and pd.api.types.is_numeric_dtype(df[column])]
+    text = [column for column in df.columns if column not in ID_DTYPES and column not in numeric]
+    values = df[numeric].astype('float64')
+    grouped = values.groupby(models)
+    non_null, lows, highs = grouped.count(), grouped.min(), grouped.max()
+    integer = (values.isna() | (values == np.floor(values))).groupby(models).all()
+    text_non_null = df[text].notna().groupby(models).sum()
+    result = {}
+    for model, n_rows in rows.items():
+        columns = {}
+        for column in df.columns:
+            if column in ID_DTYPES:
+                columns[column] = [int(n_rows)]
+            elif column in text:
+                columns[column] = [int(text_non_null.at[model, column])]
+            else:
+                count = int(non_null.at[model, column])
+                low, high = (float(lows.at[model, column]), float(highs.at[model, column])) if count else (None, None)
+                columns[column] = [count, bool(integer.at[model, column]), low, high]
+        result[model] = (int(n_rows), columns)
+    return result
+
+
+class SchemaRegistry(object):
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.years = {}
+        if os.path.exists(filepath):
+            with open(filepath) as f:
+                self.years = json.load(f)['years']
+        self._files = {csv_filename for year in self.years.values() for csv_filename in year['files']}
+
+    def has_file(self, csv_filename):
+        return csv_filename in self._files
+
+    def add_day(self, csv_filename, df):
+        year = self.years.setdefault(csv_filename[:4], {'files': [], 'models': {}})
+        for model, (rows, columns) in count_day(df).items():
+            stats = year['models'].setdefault(model, {'rows': 0, 'columns': {}})
+            stats['rows'] += rows
+            for column, counters in columns.items():
+                stats['columns'][column] = merge_counters(stats['columns'].get(column), counters)
+        year['files'].append(csv_filename)
+        self._files.add(csv_filename)
+
+    def _merged(self, years=None, models=None):
+        # rows and counters of columns over years and models, columns in order of appearance
+        rows, columns = 0, {}
+        for year, year_stats in self.years.items():
+            if years is not None and int(year) not in years:
+                continue
+            for model, stats in year_stats['models'].items():
+                if models is not None and model not in models:
+                    continue
+                rows += stats['rows']
+                for column, counters in stats['columns'].items():
+                    columns[column] = merge_counters(columns.get(column), counters)
+        return rows, columns
+
+    def columns(self, years=None, models=None):
+        # populated columns, years/models: None - all of them
+        _, columns = self._merged(years, models)
+        return [column for column, counters in columns.items() if counters[0] > 0]
+
+    def dtypes(self, years=None, models=None, columns=None):
+        rows, counters = self._merged(years, models)
+        return {column: get_dtype(column, rows, column_counters) for column, column_counters in counters.items()
+                if columns is None or column in columns}
+
+    def save(self):
+        tmp_filepath = self.filepath + '.tmp'
+        with open(tmp_filepath, 'w') as f:
+            json.dump({'years': self.years}, f)
+        os.replace(tmp_filepath, self.filepath)
+
+
+def find_schema_path(path):
+    # the registry is in a dataset folder: path is the folder, a year folder, a daily file or a cached day
+    folder = path if os.path.isdir(path) else os.path.dirname(path)
+    for _ in range(4):
+        schema_path = os.path.join(folder, SCHEMA_FILE)
+        if os.path.exists(schema_path):
+            return schema_path
+        folder = os.path.dirname(folder)
+    return None
+
+
+def load_schema(path):
+    schema_path = find_schema_path(path)
+    if schema_path is None:
+        return None
+    mtime = os.path.getmtime(schema_path)
+    if schema_path not in _schemas or _schemas[schema_path][0] != mtime:
+        _schemas[schema_path] = (mtime, SchemaRegistry(schema_path))
+    return _schemas[schema_path][1]
+
+
+def get_day_dtypes(csv_filepath, columns=None, models=None):
+    # compact dtypes to read a daily file, None if the file isn't in a registry
+    schema = load_schema(csv_filepath)
+    csv_filename = os.path.basename(csv_filepath)
+    if schema is None or not schema.has_file(csv_filename):
+        return None
+    return schema.dtypes([int(csv_filename[:4])], models, columns)
+
+
+def update_schema(folder, years=None, read_ahead=2):
+    # only daily files which are not in the registry are read, the registry is saved after every year
+    schema = SchemaRegistry(os.path.join(folder, SCHEMA_FILE))
+    files = [(csv_filename, csv_filepath) for csv_filename, csv_filepath in iget_next_csv(folder)
+             if not schema.has_file(csv_filename) and (not years or int(csv_filename[:4]) in years)]
+
+    def read(file):
+        with PROFILER.phase('read', file[1]):
+            return read_day(file[1])
+    current_year = None
+    for (csv_filename, csv_filepath), df in tqdm(iread_ahead(read, files, read_ahead), total=len(files),
+                                                 desc='Update schema of {}'.format(folder)):
+        if current_year is not None and csv_filename[:4] != current_year:
+            schema.save()
+        current_year = csv_filename[:4]
+        with PROFILER.phase('count', csv_filepath):
+            schema.add_day(csv_filename, df)
+        PROFILER.count(csv_filepath, rows_read=len(df))
+    schema.save()
+    return schema
+
+
+def show_schema(schema):
+    for year, year_stats in sorted(schema.years.items()):
+        print('{}: {} files, {} models'.format(year, len(year_stats['files']), len(year_stats['models'])))
+        for model in sorted(year_stats['models']):
+            dtypes = schema.dtypes([int(year)], [model], schema.columns([int(year)], [model]))
+            counts = pd.Series(list(dtypes.values()), dtype=object).value_counts()
+            print('\t{}: {} rows, {} populated columns ({})'.format(
+                model, year_stats['models'][model]['rows'], len(dtypes),
+                ', '.join('{} {}'.format(count, dtype) for dtype, count in counts.items())))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    add_schema_arguments(parser)
+    return parser.parse_args()
+
+
+def check_args(args):
+    check_schema_arguments(args)
+
+
+def main(args):
+    with profile_run(args.profile, args.cprofile):
+        schema = update_schema(args.folder, args.year, args.read_ahead)
+    if args.show:
+        show_schema(schema)
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    check_args(args)
+    main(args)
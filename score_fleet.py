@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import numpy as np
+from columnar_cache import iget_next_csv, iread_day, read_day_header
+from models.kdd import KDD_Hardcoded
+from schema import get_day_dtypes
+from profiling import PROFILER, profile_run
+from sdfp import add_score_arguments, check_score_arguments
+
+
+# Scores daily snapshots (YYYY-MM-DD.csv in the layout of download_dataset.py) as they appear in a folder.
+# Every file is read by chunks, so memory doesn't depend on a fleet size. A file is scored when its size and
+# modification time didn't change since the previous check (a file being extracted is skipped), names of scored files
+# are appended to a file next to the alerts, so a restart doesn't send alerts of scored files again.
+ID_COLUMNS = ['date', 'serial_number', 'model', 'vendor']
+ALERT_COLUMNS = ['date', 'serial_number', 'model', 'probability', 'confidence']
+
+
+class FileSink(object):
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._write_header = not os.path.exists(filepath)
+
+    def write(self, alerts):
+        alerts.to_csv(self.filepath, mode='a', header=self._write_header, index=False)
+        self._write_header = False
+
+    def close(self):
+        pass
+
+
+class ScoredFiles(object):
+    # names of scored daily files, one per line
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._names = set()
+        if os.path.exists(filepath):
+            with open(filepath) as f:
+                self._names = {line.strip() for line in f if line.strip()}
+
+    def __contains__(self, csv_filename):
+        return csv_filename in self._names
+
+    def add(self, csv_filename):
+        with open(self.filepath, 'a') as f:
+            f.write(csv_filename + '\n')
+        self._names.add(csv_filename)
+
+
+class SocketSink(object):
+    # alerts are sent as json lines to host:port or to a unix socket path
+    def __init__(self, address):
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+            self._socket = socket.create_connection((host, int(port)))
+        else:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(address)
+
+    def write(self, alerts):
+        lines = ''.join(json.dumps(alert) + '\n' for alert in alerts.to_dict(orient='records'))
+        self._socket.sendall(lines.encode())
+
+    def close(self):
+        self._socket.close()
+
+
+class Throughput(object):
+    def __init__(self):
+        self.start = time.time()
+        self.files = self.rows = self.alerts = 0
+
+    def update(self, rows, alerts):
+        self.rows += rows
+        self.alerts += alerts
+
+    def report(self):
+        elapsed = max(time.time() - self.start, 1e-9)
+        return 'files: {}, rows: {}, alerts: {}, files/sec: {:.2f}, rows/sec: {:.0f}'.format(
+            self.files, self.rows, self.alerts, self.files / elapsed, self.rows / elapsed)
+
+
+def score_file(model, csv_filepath, sink, threshold, chunksize, throughput):
+    header = read_day_header(csv_filepath)
+    usecols = [column for column in header if column in ID_COLUMNS + model.ATTRIBUTES]
+    chunks = iread_day(csv_filepath, usecols, chunksize=chunksize, dtypes=get_day_dtypes(csv_filepath, usecols))
+    for chunk in PROFILER.iter('read', chunks, csv_filepath):
+        for attribute in model.ATTRIBUTES:  # attributes which are not reported by a day
+            if attribute not in chunk.columns:
+                chunk[attribute] = np.nan
+        with PROFILER.phase('predict', csv_filepath):
+            prediction = model.predict_with_confidence(chunk)
+            alerts = chunk[['date', 'serial_number', 'model']].assign(
+                probability=prediction.probability, confidence=prediction.confidence)
+            alerts = alerts[alerts['probability'] >= threshold]
+        if len(alerts):
+            with PROFILER.phase('sink', csv_filepath):
+                sink.write(alerts[ALERT_COLUMNS])
+        throughput.update(len(chunk), len(alerts))
+        PROFILER.count(csv_filepath, rows_read=len(chunk), rows_kept=len(alerts))
+    throughput.files += 1
+
+
+def get_file_state(csv_filepath):
+    # (size, modification time) of a csv file, None for a cached day: the cache of a quarter is renamed when it's ready
+    if not os.path.exists(csv_filepath):
+        return None
+    stat = os.stat(csv_filepath)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def score_fleet(folder, sink, scored, threshold=0.5, chunksize=64*1024, interval=60, once=False, stable_seconds=5):
+    # scored: ScoredFiles, new files are checked again after stable_seconds, at most after interval
+    model = KDD_Hardcoded()
+    throughput = Throughput()
+    states = {}  # csv_filename -> a state of a file which isn't scored yet, at the previous check
+    try:
+        while True:
+            new_files = [(name, path) for name, path in iget_next_csv(folder) if name not in scored]
+            previous_states, states = states, {}
+            for csv_filename, csv_filepath in new_files:
+                state = get_file_state(csv_filepath)
+                if state is not None and previous_states.get(csv_filename) != state:
+                    states[csv_filename] = state  # the file can be written yet
+                    continue
+                score_file(model, csv_filepath, sink, threshold, chunksize, throughput)
+                scored.add(csv_filename)
+                print('scored {}, {}'.format(csv_filename, throughput.report()), file=sys.stderr)
+            if once and not states:
+                break
+            time.sleep(min(stable_seconds, interval) if states else interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+    print(throughput.report())
+    return throughput
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    add_score_arguments(parser)
+    return parser.parse_args()
+
+
+def check_args(args):
+    check_score_arguments(args)
+
+
+def main(args):
+    sink = SocketSink(args.socket) if args.socket else FileSink(args.out)
+    scored = ScoredFiles(args.scored if args.scored else args.out + '.scored')
+    with profile_run(args.profile, args.cprofile):
+        score_fleet(args.folder, sink, scored, args.threshold, args.chunksize, args.interval, args.once,
+                    args.stable_seconds)
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    check_args(args)
+    main(args)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+import importlib
+from dataset_files import FORMATS, get_stats_year, set_out_path
+from profiling import add_profile_arguments
+
+
+# One command for the pipeline scripts: sdfp.py <download|schema|stats|collect|clean|score> [arguments].
+# Only the standard library is imported until arguments are parsed and checked, the module of a subcommand
+# (and pandas, requests, ...) is imported to run it. Scripts take and check their arguments here as well,
+# so "python collect_stats.py ..." and "python sdfp.py stats ..." accept the same arguments.
+ENGINES = ['rows', 'columnar', 'compact']
+
+
+def add_download_arguments(parser):
+    parser.add_argument('--backblaze', action='store_true')
+    parser.add_argument('--tgt_folder', type=str, default='data')
+    parser.add_argument('-y', '--year', type=int, action='append', required=True)
+    parser.add_argument('--cache', action='store_true', help='convert csv files into a columnar cache')
+    parser.add_argument('--workers', type=int, default=4, help='count of parallel downloads')
+    parser.add_argument('--url_template', type=str, default=None,
+                        help='url of zip files with {time} placeholder, BackBlaze storage by default')
+    add_profile_arguments(parser)
+
+
+def check_download_arguments(args):
+    if not args.backblaze:
+        raise RuntimeError("A storage is unknown")
+
+
+def add_schema_arguments(parser):
+    parser.add_argument('--folder', type=str, default='data')
+    parser.add_argument('-y', '--year', type=int, action='append', help='all years by default')
+    parser.add_argument('--read_ahead', type=int, default=2, help='threads reading next daily files, 0 - no threads')
+    parser.add_argument('--show', action='store_true', help='print populated columns and dtypes per year and model')
+    add_profile_arguments(parser)
+
+
+def check_folder(folder):
+    if not os.path.exists(folder):
+        raise RuntimeError("Folder {} doesn't exist".format(folder))
+
+
+def check_schema_arguments(args):
+    check_folder(args.folder)
+
+
+def add_stats_arguments(parser):
+    parser.add_argument('--dump', action='store_true')
+    parser.add_argument('--stats_filepath', type=str, default=os.path.join('data', 'stats.csv'))
+    parser.add_argument('--folder', type=str, default='data')
+    parser.add_argument('-y', '--year', type=int, action='append')
+    parser.add_argument('--engine', type=str, choices=ENGINES, default='rows')
+    parser.add_argument('--workers', type=int, default=1, help='>1 implies columnar engine')
+    parser.add_argument('--store', type=str, default=None,
+                        help='sqlite stats store, only new daily files are processed (implies columnar engine)')
+    parser.add_argument('--format', type=str, choices=FORMATS, default='csv')
+    parser.add_argument('--read_ahead', type=int, default=2,
+                        help='threads reading next daily files of the sequential pass, 0 - no threads')
+    parser.add_argument('--sample', type=int, default=0,
+                        help='save a stratified sample of N healthy drives per model with all failured drives')
+    parser.add_argument('--sample_min_days', type=int, default=120,
+                        help='min lifetime of sampled healthy drives, --days_before of collect_data.py')
+    parser.add_argument('--lifetime', action='store_true',
+                        help='save stats of drives over all years (stats_lifetime.csv) for a cross year dataset')
+    add_profile_arguments(parser)
+
+
+def check_stats_arguments(args):
+    check_folder(args.folder)
+    if args.sample and (args.workers > 1 or args.store):
+        raise RuntimeError('--sample is collected by the sequential pass, without --workers and --store')
+
+
+def add_collect_arguments(parser):
+    parser.add_argument('--path', type=str, required=True)
+    parser.add_argument('--stats', type=str, action='append', required=True,
+                        help='several stats files (stats_YYYY.csv) are processed in one pass')
+    parser.add_argument('--out', type=str, default=None,
+                        help='output file, or output folder for several models/stats files')
+
+    parser.add_argument('--format', type=str, choices=FORMATS, default='csv', help='format of outputs')
+    parser.add_argument('--model', type=str, action='append',
+                        help='ST4000DM000 by default, several models are processed in one pass')
+    parser.add_argument('--days_before', type=int, action='append',
+                        help='120 by default, several horizons are processed in one pass')
+    parser.add_argument('--health_drives', type=int, default=10*1000)
+    parser.add_argument('--read_ahead', type=int, default=2,
+                        help='threads reading next daily files while the current one is processed, 0 - no threads')
+    parser.add_argument('--cross_year', action='store_true',
+                        help='stats files are merged per drive, windows span years of --path')
+    add_profile_arguments(parser)
+
+
+def check_collect_arguments(args):
+    args.model = args.model if args.model else ['ST4000DM000']
+    args.days_before = args.days_before if args.days_before else [120]
+    if args.cross_year:  # one output per model and horizon for all stats files
+        args.multi = len(args.model) > 1 or len(args.days_before) > 1
+        if args.out is None:
+            args.out = '.' if args.multi else set_out_path(args.model[0], None, args.format)
+        return
+    args.multi = len(args.model) > 1 or len(args.stats) > 1 or len(args.days_before) > 1
+    if args.multi:
+        years = [get_stats_year(stats_path) for stats_path in args.stats]
+        if len(args.stats) > 1 and None in years:
+            raise RuntimeError('Several stats files should be named with a year: stats_YYYY.csv')
+        args.out = '.' if args.out is None else args.out
+        return
+    year = get_stats_year(args.stats[0])
+    out_path = set_out_path(args.model[0], year, args.format) if args.out is None else args.out
+    args.out = out_path
+
+
+def add_clean_arguments(parser):
+    parser.add_argument('-csv', '--csv', type=str, action='append', required=True)
+    parser.add_argument('-replace', '--replace', action='store_true')
+    parser.add_argument('--format', type=str, choices=FORMATS, default=None,
+                        help='format of results, the same as inputs by default')
+    parser.add_argument('--max_null_fraction', type=float, default=0.5,
+                        help='smart_* columns with a bigger fraction of nulls are removed')
+    parser.add_argument('--chunksize', type=int, default=256*1024, help='rows in memory')
+    add_profile_arguments(parser)
+
+
+def check_clean_arguments(args):
+    for filepath in args.csv:
+        if not os.path.exists(filepath):
+            raise RuntimeError("Filepath {} doesn't exist".format(filepath))
+
+
+def add_score_arguments(parser):
+    parser.add_argument('--folder', type=str, default='data')
+    parser.add_argument('--out', type=str, default='alerts.csv', help='csv file with alerts')
+    parser.add_argument('--socket', type=str, default=None, help='host:port or unix socket path for alerts')
+    parser.add_argument('--threshold', type=float, default=0.5, help='min failure probability of an alert')
+    parser.add_argument('--chunksize', type=int, default=64*1024)
+    parser.add_argument('--interval', type=int, default=60, help='seconds between checks for new files')
+    parser.add_argument('--once', action='store_true', help='score existing files and exit')
+    parser.add_argument('--scored', type=str, default=None,
+                        help='file with names of scored daily files, <out>.scored by default')
+    parser.add_argument('--stable_seconds', type=int, default=5,
+                        help='a new file is scored when its size and modification time are the same after it')
+    add_profile_arguments(parser)
+
+
+def check_score_arguments(args):
+    check_folder(args.folder)
+
+
+# subcommand: (module with main(args), arguments, check of arguments, help)
+COMMANDS = {
+    'download': ('download_dataset', add_download_arguments, check_download_arguments,
+                 'download daily files of the dataset'),
+    'schema': ('schema', add_schema_arguments, check_schema_arguments, 'update the schema registry of the dataset'),
+    'stats': ('collect_stats', add_stats_arguments, check_stats_arguments, 'collect stats of drives per year'),
+    'collect': ('collect_data', add_collect_arguments, check_collect_arguments,
+                'collect windows of failured and healthy drives'),
+    'clean': ('remove_nans', add_clean_arguments, check_clean_arguments, 'remove smart columns with too many nulls'),
+    'score': ('score_fleet', add_score_arguments, check_score_arguments, 'score daily files with the KDD model'),
+}
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(prog='sdfp', description='Hard drive failure predictions pipeline')
+    subparsers = parser.add_subparsers(dest='command', metavar='command', required=True)
+    for name, (module_name, add_arguments, check_arguments, help) in COMMANDS.items():
+        add_arguments(subparsers.add_parser(name, help=help, description=help))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    module_name, _, check_arguments, _ = COMMANDS[args.command]
+    check_arguments(args)  # before dependencies of the command are imported
+    importlib.import_module(module_name).main(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from collections import namedtuple
+import numpy as np
+from formats import read_table
+from profiling import PROFILER, add_profile_arguments, profile_run
+
+
+# Fixed length windows of SMART attributes per drive for neural nets (see NeuralNet.ipynb):
+# the last `length` days of every drive with at least `length` days in a dataset file.
+# Windows are cached as .npy files and opened with mmap on the next load.
+Sequences = namedtuple('Sequences', ['X', 'y', 'serial_numbers'])
+
+DEFAULT_ATTRIBUTES = ['smart_{}_raw'.format(idx) for idx in [188, 197, 240]] + \
+                     ['smart_{}_normalized'.format(idx) for idx in [1, 187]]
+CACHE_DIR = '.sequence_cache'
+
+
+def build_sequences(df, attributes, length):
+    # df: rows of collect_data.py output, drives are sorted by serial number, days by date
+    serial_numbers = df['serial_number'].to_numpy(dtype=str)
+    order = np.lexsort((df['date'].to_numpy(dtype=str), serial_numbers))
+    serial_numbers = serial_numbers[order]
+    drives, starts, sizes = np.unique(serial_numbers, return_index=True, return_counts=True)
+    keep = sizes >= length
+    drives, ends = drives[keep], starts[keep] + sizes[keep]
+    rows = order[(ends[:, None] - length + np.arange(length)[None, :]).ravel()]
+    X = df[attributes].values[rows].astype(np.float32).reshape(len(drives), length, len(attributes))
+    y = df['failure'].values[rows].reshape(len(drives), length)[:, 0].astype(np.int64)
+    return Sequences(X, y, drives)
+
+
+def get_cache_key(filepaths, attributes, length):
+    # a file is identified by its path, size and modification time
+    hasher = hashlib.sha1()
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        hasher.update(json.dumps([os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns]).encode())
+    hasher.update(json.dumps([list(attributes), length]).encode())
+    return hasher.hexdigest()
+
+
+def save_sequences(folder, sequences_list):
+    tmp_folder = folder + '.tmp'
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    os.makedirs(tmp_folder)
+    n = sum(len(sequences.y) for sequences in sequences_list)
+    for name in Sequences._fields:
+        first = getattr(sequences_list[0], name)
+        array = np.lib.format.open_memmap(os.path.join(tmp_folder, name + '.npy'), mode='w+',
+                                          dtype=first.dtype, shape=(n,) + first.shape[1:])
+        start = 0
+        for sequences in sequences_list:
+            values = getattr(sequences, name)
+            array[start:start + len(values)] = values
+            start += len(values)
+        array.flush()
+        del array
+    shutil.rmtree(folder, ignore_errors=True)
+    os.rename(tmp_folder, folder)
+
+
+def load_cached(folder):
+    return Sequences(*[np.load(os.path.join(folder, name + '.npy'), mmap_mode='r') for name in Sequences._fields])
+
+
+def load_sequences(filepaths, attributes=DEFAULT_ATTRIBUTES, length=21, cache_dir=CACHE_DIR):
+    # filepaths: csv or parquet outputs of collect_data.py, windows never cross files
+    filepaths = [filepaths] if isinstance(filepaths, str) else list(filepaths)
+    folder = os.path.join(cache_dir, get_cache_key(filepaths, attributes, length))
+    if not os.path.exists(folder):
+        sequences_list = []
+        for filepath in filepaths:  # only needed columns are read
+            with PROFILER.phase('read', filepath):
+                df = read_table(filepath, columns=['date', 'serial_number', 'failure'] + list(attributes))
+            with PROFILER.phase('build', filepath):
+                sequences_list.append(build_sequences(df, attributes, length))
+            PROFILER.count(filepath, rows_read=len(df), rows_kept=len(sequences_list[-1].y) * length)
+            del df
+        with PROFILER.phase('save'):
+            save_sequences(folder, sequences_list)
+    return load_cached(folder)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Process arguments')
+    parser.add_argument('-csv', '--csv', type=str, action='append', required=True)
+    parser.add_argument('--length', type=int, default=21)
+    parser.add_argument('-a', '--attribute', type=str, action='append', help='KDD attributes by default')
+    parser.add_argument('--cache_dir', type=str, default=CACHE_DIR)
+    add_profile_arguments(parser)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+    attributes = args.attribute if args.attribute else DEFAULT_ATTRIBUTES
+    with profile_run(args.profile, args.cprofile):
+        sequences = load_sequences(args.csv, attributes, args.length, args.cache_dir)
+    print('windows: {}, shape: {}, failured: {}'.format(len(sequences.y), sequences.X.shape, int(sequences.y.sum())))
@@ -0,0 +1,84 @@
+import os
+import sqlite3
+import pandas as pd
+
+
+class StatsStore(object):
+    """
+    Persistent per drive stats (sqlite), updated in place by partial aggregates of daily files.
+    Every fold is committed together with the list of folded files,
+    so a rerun (or a resumed run after an interruption) reads only files which are not folded yet.
+    """
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS drives (
+            year INTEGER NOT NULL,
+            model TEXT NOT NULL,
+            serial_number TEXT NOT NULL,
+            ord INTEGER NOT NULL,
+            first_seen INTEGER NOT NULL,
+            last_seen INTEGER NOT NULL,
+            n_failures INTEGER NOT NULL,
+            first_failure INTEGER NOT NULL,
+            failure_date INTEGER NOT NULL,
+            PRIMARY KEY (year, model, serial_number)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS files (
+            filepath TEXT PRIMARY KEY,
+            year INTEGER NOT NULL
+        )''',
+    ]
+    # all values on the right side refer to the row before the update
+    UPSERT = '''
+        INSERT INTO drives VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (year, model, serial_number) DO UPDATE SET
+            first_failure = CASE WHEN excluded.ord < ord THEN excluded.first_failure ELSE first_failure END,
+            ord = MIN(ord, excluded.ord),
+            first_seen = MIN(first_seen, excluded.first_seen),
+            last_seen = MAX(last_seen, excluded.last_seen),
+            n_failures = n_failures + excluded.n_failures,
+            failure_date = MAX(failure_date, excluded.failure_date)
+    '''
+    TABLE_COLUMNS = ['model', 'serial_number', 'order', 'first_seen', 'last_seen',
+                     'n_failures', 'first_failure', 'failure_date']
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        for statement in self.SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def _key(self, filepath):
+        # daily files are named by date, a day read from the columnar cache has the same key
+        return os.path.basename(filepath)
+
+    def processed_files(self):
+        return {row[0] for row in self._conn.execute('SELECT filepath FROM files')}
+
+    def new_files(self, files):
+        processed = self.processed_files()
+        return [(file_idx, filepath) for file_idx, filepath in files if self._key(filepath) not in processed]
+
+    def fold(self, year, table, filepaths):
+        # table: partial aggregates (see collect_stats.reduce_aggregates) of filepaths
+        rows = zip([year] * len(table), table['model'], table['serial_number'],
+                   table['order'].astype(int), table['first_seen'].astype(int),
+                   table['last_seen'].astype(int), table['n_failures'].astype(int),
+                   table['first_failure'].astype(int), table['failure_date'].astype(int))
+        with self._conn:  # one transaction: stats and checkpoint are stored together
+            self._conn.executemany(self.UPSERT, rows)
+            self._conn.executemany('INSERT OR IGNORE INTO files VALUES (?, ?)',
+                                   [(self._key(filepath), year) for filepath in filepaths])
+
+    def load_year(self, year):
+        table = pd.read_sql_query(
+            'SELECT model, serial_number, ord, first_seen, last_seen, n_failures, first_failure, failure_date '
+            'FROM drives WHERE year = ?', self._conn, params=(year,))
+        if table.empty:
+            return None
+        table.columns = self.TABLE_COLUMNS
+        table['first_failure'] = table['first_failure'].astype(bool)
+        return table
@@ -0,0 +1,46 @@
+import pandas as pd
+from collect_data import DumpJob, dump_data, dump_data_multi
+
+HEADER = 'date,serial_number,model,capacity_bytes,failure,smart_5_raw\n'
+
+
+def write_csv(filepath, rows):
+    with open(filepath, 'w') as f:
+        f.write(HEADER)
+        for date, serial_number, value in rows:
+            f.write('{},{},ST4000DM000,4000787030016,0,{}\n'.format(date, serial_number, value))
+
+
+def make_dataset(tmp_path):
+    # daily files and a snapshot without a date in its name
+    folder = tmp_path / 'data' / 'data_2018'
+    folder.mkdir(parents=True)
+    write_csv(str(folder / '2018-01-01.csv'), [('2018-01-01', 'SN1', 1), ('2018-01-01', 'SN2', 2)])
+    write_csv(str(folder / '2018-01-02.csv'), [('2018-01-02', 'SN1', 3), ('2018-01-02', 'SN2', 4)])
+    write_csv(str(folder / 'extra_snapshot.csv'), [('2018-01-03', 'SN1', 5), ('2018-01-03', 'SN3', 6)])
+    return str(tmp_path / 'data')
+
+
+def windows(serial_numbers, start='2018-01-01', end='2018-01-03'):
+    return pd.DataFrame({'serial_number': serial_numbers, 'start': pd.to_datetime(start), 'end': pd.to_datetime(end)})
+
+
+def test_rows_of_files_without_a_date_reach_the_output(tmp_path):
+    in_path = make_dataset(tmp_path)
+    out_path = str(tmp_path / 'out.csv')
+    dump_data(in_path, out_path, windows(['SN1']), windows(['SN2']), read_ahead=0)
+    rows = pd.read_csv(out_path, dtype=str)
+    assert list(zip(rows['date'], rows['serial_number'], rows['smart_5_raw'], rows['failure'])) == [
+        ('2018-01-01', 'SN1', '1', '1'), ('2018-01-01', 'SN2', '2', '0'),
+        ('2018-01-02', 'SN1', '3', '1'), ('2018-01-02', 'SN2', '4', '0'),
+        ('2018-01-03', 'SN1', '5', '1')]
+
+
+def test_files_without_a_year_are_skipped_by_jobs_of_a_year(tmp_path):
+    in_path = make_dataset(tmp_path)
+    jobs = [DumpJob('ST4000DM000', 2018, str(tmp_path / 'year.csv'), windows(['SN1']), windows([])),
+            DumpJob('ST4000DM000', None, str(tmp_path / 'any.csv'), windows(['SN1']), windows([]))]
+    dump_data_multi(in_path, jobs, read_ahead=2, background_writers=False)
+    assert list(pd.read_csv(str(tmp_path / 'year.csv'), dtype=str)['date']) == ['2018-01-01', '2018-01-02']
+    assert list(pd.read_csv(str(tmp_path / 'any.csv'), dtype=str)['date']) == \
+        ['2018-01-01', '2018-01-02', '2018-01-03']
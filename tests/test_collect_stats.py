@@ -0,0 +1,35 @@
+import numpy as np
+from collect_stats import DriveReservoir
+
+
+def add_day(reservoir, day, drives):
+    # drives: [(serial number, priority, failure)]
+    serial_numbers = np.array([sn for sn, _, _ in drives], dtype=object)
+    priorities = np.array([priority for _, priority, _ in drives], dtype=np.uint64)
+    failures = np.array([failure for _, _, failure in drives], dtype=bool)
+    reservoir.add(serial_numbers, priorities, np.full(len(drives), day, dtype=np.int32), failures)
+
+
+def test_reservoir_keeps_updating_the_threshold_drive():
+    reservoir = DriveReservoir(2)
+    add_day(reservoir, 0, [('a', 1, False), ('b', 5, False), ('c', 9, False)])
+    assert list(reservoir.serial_numbers) == ['a', 'b']
+    assert reservoir.threshold == 5
+    for day in range(1, 4):
+        add_day(reservoir, day, [('a', 1, False), ('b', 5, False), ('c', 9, False)])
+    add_day(reservoir, 4, [('a', 1, False), ('b', 5, True)])
+    assert list(reservoir.last_seen) == [4, 4]
+    assert list(reservoir.failed) == [False, True]
+    assert list(reservoir.first_seen) == [0, 0]
+
+
+def test_reservoir_drives_are_kept_from_their_first_day():
+    reservoir = DriveReservoir(2)
+    add_day(reservoir, 0, [('a', 3, False), ('b', 5, False), ('c', 9, False)])
+    add_day(reservoir, 1, [('a', 3, False), ('b', 5, False), ('c', 9, False), ('d', 1, False), ('e', 5, False)])
+    assert list(reservoir.serial_numbers) == ['a', 'd']
+    assert list(reservoir.first_seen) == [0, 1]
+    add_day(reservoir, 2, [('a', 3, False), ('b', 5, False), ('c', 9, True), ('d', 1, False)])
+    assert list(reservoir.serial_numbers) == ['a', 'd']
+    assert list(reservoir.last_seen) == [2, 2]
+    assert not reservoir.failed.any()
@@ -0,0 +1,149 @@
+import io
+import os
+import hashlib
+import zipfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from download_dataset import BackBlaze
+
+DAY = 'date,serial_number,model,capacity_bytes,failure,smart_1_raw\n2015-01-01,SN1,ST4000DM000,4000787030016,0,1\n'
+
+
+def make_zip(n_days=3):
+    # a quarter of the dataset: data_<time>/<date>.csv
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for day in range(1, n_days + 1):
+            zip_ref.writestr('data_2015/2015-01-{:02d}.csv'.format(day), DAY * 100)
+    return buffer.getvalue()
+
+
+class Storage(object):
+    # files of the server by url path, sha1 headers (None - not sent) and Range headers of requests
+    def __init__(self):
+        self.files, self.sha1s, self.ranges = {}, {}, []
+        self.support_range = True
+
+    def add(self, path, data, sha1=True):
+        self.files[path] = data
+        self.sha1s[path] = hashlib.sha1(data).hexdigest() if sha1 is True else sha1
+
+
+def make_handler(storage):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in storage.files:
+                self.send_error(404)
+                return
+            data, sha1 = storage.files[self.path], storage.sha1s[self.path]
+            header = self.headers.get('Range')
+            storage.ranges.append(header)
+            offset = int(header[len('bytes='):-1]) if header and storage.support_range else 0
+            if offset >= len(data) and offset:
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(len(data)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206 if offset else 200)
+            if offset:
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(offset, len(data) - 1, len(data)))
+            if sha1 is not None:
+                self.send_header('x-bz-content-sha1', sha1)
+            self.send_header('Content-Length', str(len(data) - offset))
+            self.end_headers()
+            self.wfile.write(data[offset:])
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+@pytest.fixture
+def storage():
+    storage = Storage()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(storage))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    storage.url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    yield storage
+    server.shutdown()
+    server.server_close()
+
+
+def make_backblaze(storage, tmp_path):
+    return BackBlaze(str(tmp_path / 'data'), years=[2015], workers=1,
+                     link_template=storage.url + '/data_{time}.zip')
+
+
+def test_load(storage, tmp_path):
+    storage.add('/data_2015.zip', make_zip())
+    make_backblaze(storage, tmp_path).load()
+    folder = tmp_path / 'data'
+    assert sorted(os.listdir(str(folder / '2015' / 'data_2015'))) == \
+        ['2015-01-01.csv', '2015-01-02.csv', '2015-01-03.csv']
+    assert sorted(os.listdir(str(folder))) == ['2015']
+    assert storage.ranges == [None]
+
+
+@pytest.mark.parametrize('support_range', [True, False])
+def test_resume_part_file(storage, tmp_path, support_range):
+    data = make_zip()
+    storage.add('/data_2015.zip', data)
+    storage.support_range = support_range
+    backblaze = make_backblaze(storage, tmp_path)
+    filepath = os.path.join(backblaze.folder, 'data_2015.zip')
+    with open(filepath + '.part', 'wb') as f:
+        f.write(data[:len(data) // 3])
+    backblaze._download_file(backblaze._form_url(2015), filepath)
+    assert storage.ranges == ['bytes={}-'.format(len(data) // 3)]
+    with open(filepath, 'rb') as f:
+        assert f.read() == data
+    assert not os.path.exists(filepath + '.part')
+
+
+def test_complete_part_file(storage, tmp_path):
+    # the server answers 416 for a range after the end of the file
+    data = make_zip()
+    storage.add('/data_2015.zip', data)
+    backblaze = make_backblaze(storage, tmp_path)
+    filepath = os.path.join(backblaze.folder, 'data_2015.zip')
+    with open(filepath + '.part', 'wb') as f:
+        f.write(data)
+    backblaze._download_file(backblaze._form_url(2015), filepath)
+    assert storage.ranges == ['bytes={}-'.format(len(data))]
+    with open(filepath, 'rb') as f:
+        assert f.read() == data
+
+
+def test_size_mismatch(storage, tmp_path):
+    data = make_zip()
+    storage.add('/data_2015.zip', data)
+    backblaze = make_backblaze(storage, tmp_path)
+    filepath = os.path.join(backblaze.folder, 'data_2015.zip')
+    with open(filepath + '.part', 'wb') as f:
+        f.write(data + b'garbage')
+    with pytest.raises(RuntimeError, match='size'):
+        backblaze._download_file(backblaze._form_url(2015), filepath)
+    assert not os.path.exists(filepath + '.part') and not os.path.exists(filepath)
+
+
+def test_sha1_mismatch(storage, tmp_path):
+    storage.add('/data_2015.zip', make_zip(), sha1=hashlib.sha1(b'other').hexdigest())
+    backblaze = make_backblaze(storage, tmp_path)
+    filepath = os.path.join(backblaze.folder, 'data_2015.zip')
+    with pytest.raises(RuntimeError, match='sha1'):
+        backblaze._download_file(backblaze._form_url(2015), filepath)
+    assert not os.path.exists(filepath + '.part') and not os.path.exists(filepath)
+
+
+def test_broken_zip_without_sha1(storage, tmp_path):
+    data = bytearray(make_zip())
+    data[40] ^= 0xff  # a byte of the first compressed file, after its local header
+    storage.add('/data_2015.zip', bytes(data), sha1=None)
+    backblaze = make_backblaze(storage, tmp_path)
+    filepath = os.path.join(backblaze.folder, 'data_2015.zip')
+    with pytest.raises(RuntimeError, match='broken'):
+        backblaze._download_file(backblaze._form_url(2015), filepath)
+    assert not os.path.exists(filepath + '.part') and not os.path.exists(filepath)
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from features import FeatureBuilder
+
+
+def make_rows(n_drives=6, n_days=12, seed=0):
+    # collect_data.py output: text values, rows by date
+    rng = np.random.RandomState(seed)
+    dates = pd.date_range('2018-01-01', periods=n_days).strftime('%Y-%m-%d')
+    rows = pd.DataFrame([(date, 'SN{:02d}'.format(drive)) for date in dates for drive in range(n_drives)],
+                        columns=['date', 'serial_number'])
+    values = rng.randint(0, 3, len(rows)).astype(float)
+    values[rng.rand(len(rows)) < 0.2] = np.nan
+    rows['smart_5_raw'] = ['' if np.isnan(value) else str(int(value)) for value in values]
+    return rows
+
+
+def transform(rows, chunksize, sorted_by_serial=False):
+    builder = FeatureBuilder(['smart_5_raw'], windows=[3, 5], lags=[2], sorted_by_serial=sorted_by_serial)
+    return pd.concat([builder.transform(rows.iloc[start:start + chunksize])
+                      for start in range(0, len(rows), chunksize)])
+
+
+@pytest.mark.parametrize('chunksize', [1, 5, 7, 37])
+def test_chunks_of_date_sorted_rows(chunksize):
+    # the first chunk of 5 rows is sorted by serial_number as well
+    rows = make_rows()
+    pd.testing.assert_frame_equal(transform(rows, chunksize), transform(rows, len(rows)))
+
+
+@pytest.mark.parametrize('chunksize', [1, 5, 37])
+def test_chunks_of_serial_sorted_rows(chunksize):
+    rows = make_rows().sort_values(['serial_number', 'date']).reset_index(drop=True)
+    expected = transform(rows, len(rows))
+    pd.testing.assert_frame_equal(transform(rows, chunksize, sorted_by_serial=True), expected)
+    pd.testing.assert_frame_equal(transform(rows, chunksize), expected)
+
+
+def test_unsorted_rows_are_rejected():
+    with pytest.raises(RuntimeError):
+        transform(make_rows(), 5, sorted_by_serial=True)
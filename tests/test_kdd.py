@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from models.kdd import KDD_Hardcoded
+
+# thresholds of the rules per attribute, values next to them and missing values are sampled
+THRESHOLDS = {'smart_1_normalized': [0, 117], 'smart_187_normalized': [100], 'smart_188_raw': [0],
+              'smart_197_raw': [1, 2, 5], 'smart_240_raw': [14780 * 10**6], 'smart_1_raw': [0, 109],
+              'smart_3_raw': [626, 629], 'smart_5_raw': [17, 7200]}
+MODELS = ['ST4000DM000', 'Seagate BarraCuda 120 SSD', 'Hitachi HDS722020ALA330', 'HGST HMS5C4040BLE640',
+          'WDC WD30EFRX', 'TOSHIBA MQ01ABF050', 'st4000dm000']
+
+
+def make_metrics(n_rows, seed=0):
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({'model': rng.choice(MODELS, n_rows)})
+    for attribute in KDD_Hardcoded.ATTRIBUTES:
+        boundaries = [value + shift for value in THRESHOLDS[attribute] for shift in (-1, 0, 1)] + [np.nan]
+        df[attribute] = np.where(rng.rand(n_rows) < 0.8, rng.choice(boundaries, n_rows),
+                                 rng.uniform(-10, 2 * max(THRESHOLDS[attribute]) + 10, n_rows))
+    return df
+
+
+def predict_rows(model, df):
+    predictions = [model._predict(row) for row in df.to_dict('records')]
+    return np.array([p.probability for p in predictions]), np.array([p.confidence for p in predictions])
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_vectorized_predictions_match_rows(seed):
+    model, df = KDD_Hardcoded(), make_metrics(5000, seed)
+    probability, confidence = model.predict_with_confidence(df)
+    expected_probability, expected_confidence = predict_rows(model, df)
+    np.testing.assert_array_equal(probability, expected_probability)
+    np.testing.assert_array_equal(confidence, expected_confidence)
+    np.testing.assert_array_equal(model.predict(df), expected_probability)
+
+
+def test_every_vendor_prefix_is_covered():
+    model, df = KDD_Hardcoded(), make_metrics(5000)
+    probability, confidence = model.predict_with_confidence(df)
+    # every rule of both vendors, the healthy and the unknown prediction
+    assert len(set(zip(probability, confidence))) == 7
+    for name in MODELS:
+        rows = (df['model'] == name).values
+        assert rows.any()
+        expected_probability, expected_confidence = predict_rows(model, df[rows])
+        np.testing.assert_array_equal(probability[rows], expected_probability)
+        np.testing.assert_array_equal(confidence[rows], expected_confidence)
+
+
+@pytest.mark.parametrize('columns', [['vendor'], []])
+def test_vendor_column_and_no_model(columns):
+    model, df = KDD_Hardcoded(), make_metrics(2000).drop(columns=['model'])
+    if columns:
+        df['vendor'] = np.random.RandomState(0).choice(['Seagate', 'Hitachi', 'WDC'], len(df))
+    probability, confidence = model.predict_with_confidence(df)
+    expected_probability, expected_confidence = predict_rows(model, df)
+    np.testing.assert_array_equal(probability, expected_probability)
+    np.testing.assert_array_equal(confidence, expected_confidence)
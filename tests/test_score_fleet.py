@@ -0,0 +1,46 @@
+import os
+import pandas as pd
+from score_fleet import ScoredFiles, score_fleet
+
+HEADER = 'date,serial_number,model,capacity_bytes,failure,smart_1_normalized,smart_187_normalized,smart_188_raw,' \
+         'smart_197_raw,smart_240_raw\n'
+
+
+class ListSink(object):
+    def __init__(self):
+        self.alerts = []
+
+    def write(self, alerts):
+        self.alerts.append(alerts)
+
+    def close(self):
+        pass
+
+
+def write_day(folder, date):
+    # SN1 fails by smart_197_raw, SN2 is healthy
+    with open(os.path.join(folder, date + '.csv'), 'w') as f:
+        f.write(HEADER)
+        f.write('{},SN1,ST4000DM000,4000787030016,0,100,100,0,8,1000\n'.format(date))
+        f.write('{},SN2,ST4000DM000,4000787030016,0,100,100,0,0,1000\n'.format(date))
+
+
+def test_restart_skips_scored_files(tmp_path):
+    folder = tmp_path / 'data'
+    folder.mkdir()
+    write_day(str(folder), '2018-01-01')
+    write_day(str(folder), '2018-01-02')
+    scored_path = str(tmp_path / 'alerts.csv.scored')
+    sink = ListSink()
+    score_fleet(str(folder), sink, ScoredFiles(scored_path), once=True, stable_seconds=0)
+    alerts = pd.concat(sink.alerts)
+    assert list(alerts['date']) == ['2018-01-01', '2018-01-02']
+    assert list(alerts['serial_number']) == ['SN1', 'SN1']
+
+    write_day(str(folder), '2018-01-03')
+    sink = ListSink()
+    throughput = score_fleet(str(folder), sink, ScoredFiles(scored_path), once=True, stable_seconds=0)
+    assert throughput.files == 1
+    assert list(pd.concat(sink.alerts)['date']) == ['2018-01-03']
+    with open(scored_path) as f:
+        assert f.read().split() == ['2018-01-01.csv', '2018-01-02.csv', '2018-01-03.csv']
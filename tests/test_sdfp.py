@@ -0,0 +1,23 @@
+import os
+import sys
+import subprocess
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('argv, error', [
+    (['stats', '--folder', 'no_such_folder'], "Folder no_such_folder doesn't exist"),
+    (['schema', '--folder', 'no_such_folder'], "Folder no_such_folder doesn't exist"),
+    (['score', '--folder', 'no_such_folder'], "Folder no_such_folder doesn't exist"),
+    (['clean', '-csv', 'no_such_file.csv'], "Filepath no_such_file.csv doesn't exist"),
+    (['download', '-y', '2018'], 'A storage is unknown'),
+    (['collect', '--path', 'data', '--stats', 'a.csv', '--stats', 'b.csv'], 'should be named with a year'),
+])
+def test_argument_errors_before_imports(argv, error):
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(ROOT, 'sdfp.py')] + argv,
+                            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True).stderr
+    modules = {line.rsplit('|', 1)[-1].strip() for line in stderr.splitlines() if line.startswith('import time:')}
+    assert error in stderr
+    assert not modules & {'pandas', 'numpy', 'requests', 'tqdm'}
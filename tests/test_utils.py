@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from utils import FAR, FDR, FNR, Confusion, per_drive
+
+
+def make_scores(n=2000, seed=0):
+    # scores on a coarse grid, so thresholds and 0.5 match scores of samples, some scores are missing
+    rng = np.random.RandomState(seed)
+    y_true = (rng.rand(n) < 0.2).astype(int)
+    y_pred = np.round(np.clip(rng.normal(0.3 + 0.4 * y_true, 0.2), 0, 1), 1)
+    y_pred[rng.rand(n) < 0.05] = np.nan
+    return y_true, y_pred
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_confusion_at_half_matches_metrics(seed):
+    y_true, y_pred = make_scores(seed=seed)
+    confusion = Confusion(y_true, y_pred)
+    assert confusion.FAR() == pytest.approx(FAR(y_true, y_pred))
+    assert confusion.FDR() == pytest.approx(FDR(y_true, y_pred))
+    assert confusion.FNR() == pytest.approx(FNR(y_true, y_pred))
+
+
+def test_confusion_sweep_matches_thresholds_one_by_one():
+    y_true, y_pred = make_scores()
+    confusion = Confusion(y_true, y_pred)
+    thresholds = np.append(confusion.thresholds(), [-1, 0.55, 2])
+    far, fdr = confusion.FAR(thresholds), confusion.FDR(thresholds)
+    for threshold, threshold_far, threshold_fdr in zip(thresholds, far, fdr):
+        predicted = (y_pred >= threshold).astype(float)  # binary predictions, the metrics threshold them at 0.5
+        assert threshold_far == pytest.approx(FAR(y_true, predicted))
+        assert threshold_fdr == pytest.approx(FDR(y_true, predicted))
+
+
+def test_fdr_at_far():
+    y_true, y_pred = make_scores()
+    confusion = Confusion(y_true, y_pred)
+    for max_far in [0, 0.01, 0.1, 0.5, 1]:
+        fdr, threshold = confusion.FDR_at_FAR(max_far)
+        assert confusion.FAR(threshold) <= max_far
+        assert fdr == confusion.FDR(threshold)
+        thresholds = confusion.thresholds()
+        allowed = confusion.FAR(thresholds) <= max_far
+        assert fdr >= confusion.FDR(thresholds)[allowed].max(initial=0)
+
+
+def test_fdr_at_far_without_allowed_thresholds():
+    # no healthy samples: FAR is undefined for every threshold
+    fdr, threshold = Confusion(np.ones(5, dtype=int), np.linspace(0, 1, 5)).FDR_at_FAR(0.1)
+    assert np.isnan(fdr) and threshold == np.inf
+    # no threshold meets max_far
+    y_true, y_pred = make_scores()
+    fdr, threshold = Confusion(y_true, y_pred).FDR_at_FAR(-1)
+    assert np.isnan(fdr) and threshold == np.inf
+    # no failured samples: FDR is undefined
+    fdr, threshold = Confusion(np.zeros(5, dtype=int), np.linspace(0, 1, 5)).FDR_at_FAR(0.1)
+    assert np.isnan(fdr) and threshold == np.inf
+
+
+def test_per_drive():
+    y_true = np.array([0, 0, 1, 0, 0])
+    y_pred = np.array([0.1, 0.7, 0.2, 0.3, 0.4])
+    drive_true, drive_pred = per_drive(y_true, y_pred, np.array(['b', 'a', 'b', 'c', 'a']))
+    np.testing.assert_array_equal(drive_true, [0, 1, 0])
+    np.testing.assert_array_equal(drive_pred, [0.7, 0.2, 0.3])
@@ -33,3 +33,70 @@ def FNR(y_true, y_pred):
     FN = ((y_true == 1) * (y_true != y_pred)).sum()
     return FN / (FN + TP)
 
+
+class Confusion(object):
+    '''
+    Confusion matrices for any thresholds (y_pred >= threshold is a failure).
+    Scores of failured and healthy samples are sorted once, every threshold is a binary search.
+    '''
+    def __init__(self, y_true, y_pred):
+        assert isinstance(y_true, np.ndarray) and isinstance(y_pred, np.ndarray)
+        self.n_positives, self.n_negatives = (y_true == 1).sum(), (y_true == 0).sum()
+        # NaN scores are never >= threshold
+        self.positives = np.sort(y_pred[(y_true == 1) & ~np.isnan(y_pred)])
+        self.negatives = np.sort(y_pred[(y_true == 0) & ~np.isnan(y_pred)])
+
+    def thresholds(self):
+        '''
+        All distinct scores, other thresholds give the same matrices as one of them
+        '''
+        return np.unique(np.concatenate([self.positives, self.negatives]))
+
+    def counts(self, thresholds):
+        '''
+        TP, FP, TN, FN arrays
+        '''
+        thresholds = np.asarray(thresholds)
+        TP = len(self.positives) - np.searchsorted(self.positives, thresholds, side='left')
+        FP = len(self.negatives) - np.searchsorted(self.negatives, thresholds, side='left')
+        return TP, FP, self.n_negatives - FP, self.n_positives - TP
+
+    def FAR(self, thresholds=0.5):
+        TP, FP, TN, FN = self.counts(thresholds)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return FP / (FP + TN)
+
+    def FDR(self, thresholds=0.5):
+        TP, FP, TN, FN = self.counts(thresholds)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return TP / (TP + FN)
+
+    def FNR(self, thresholds=0.5):
+        TP, FP, TN, FN = self.counts(thresholds)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return FN / (FN + TP)
+
+    def FDR_at_FAR(self, max_far):
+        '''
+        The best FDR with FAR <= max_far and its threshold,
+        (nan, inf) if no threshold meets max_far (e.g. there are no healthy samples) or there are no failured ones
+        '''
+        thresholds = np.append(self.thresholds(), np.inf)  # inf: nothing is a failure, FAR = 0
+        far, fdr = self.FAR(thresholds), self.FDR(thresholds)
+        allowed = np.flatnonzero(far <= max_far)
+        if not len(allowed) or np.isnan(fdr[allowed]).all():
+            return np.nan, np.inf
+        best = allowed[np.nanargmax(fdr[allowed])]
+        return fdr[best], thresholds[best]
+
+
+def per_drive(y_true, y_pred, serial_numbers):
+    '''
+    Samples of a drive are merged into one: a drive is failured if any sample is, its score is the max score
+    '''
+    drives, idx = np.unique(serial_numbers, return_inverse=True)
+    drive_true = np.zeros(len(drives), dtype=y_true.dtype)
+    drive_pred = np.full(len(drives), -np.inf)
+    np.maximum.at(drive_true, idx, y_true)
+    np.maximum.at(drive_pred, idx, y_pred)
+    return drive_true, drive_pred